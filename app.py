@@ -3,16 +3,31 @@
 主应用文件
 """
 import streamlit as st
-import pandas as pd
 from datetime import date
 from pathlib import Path
 import sys
 
 sys.path.append(str(Path(__file__).parent))
 
-from utils.io import load_data, get_dataset_info
-from utils.prep import clean_data, make_tables
-from sections import intro, overview, deep_dives, conclusions
+# 启动时只导入轻量模块；数据管道（pandas、pyarrow）和各页面（plotly）
+# 在首次需要时由 perf.lazy_import 导入，并记录导入耗时
+from utils.info import get_dataset_info
+from utils import perf
+
+# 页面（内部路由使用中文键）对应的模块
+SECTION_MODULES = {
+    "介绍": "sections.intro",
+    "概览": "sections.overview",
+    "深入分析": "sections.deep_dives",
+    "结论": "sections.conclusions",
+}
+
+# 后台加载期间，两次检查加载进度之间最长的等待时间（秒）
+LOAD_POLL_SECONDS = 0.5
+
+def render_page(page, *args, **kwargs):
+    """按需导入页面模块并渲染"""
+    perf.lazy_import(SECTION_MODULES[page]).render(*args, **kwargs)
 
 # 页面配置
 st.set_page_config(
@@ -40,30 +55,6 @@ if 'page' not in st.session_state:
 if 'lang' not in st.session_state:
     st.session_state.lang = 'en'
 
-# 数据加载
-@st.cache_data(show_spinner="正在加载和预处理数据...")
-def get_processed_data():
-    """加载和预处理数据"""
-    df_raw = load_data()
-    if df_raw is None:
-        return None, None, {}
-    
-    df_clean = clean_data(df_raw)
-    if df_clean is None:
-        return None, None, {}
-    
-    tables = make_tables(df_clean)
-    return df_raw, df_clean, tables
-
-# 加载数据
-df_raw, df_clean, tables = get_processed_data()
-
-if df_clean is None:
-    st.error("数据加载失败，请检查数据文件")
-    st.stop()
-
-# 标题（将在侧边栏渲染后显示，确保语言选择生效）
-
 # 侧边栏
 with st.sidebar:
     # 显示 logo 图片
@@ -123,22 +114,75 @@ with st.sidebar:
 
     st.session_state.page = page
     st.markdown("---")
-    
+
+# 在侧边栏渲染之后再显示标题和数据来源，确保语言选择先被处理
+if st.session_state.lang == 'en':
+    st.markdown('<div class="main-header">Climate and Atmospheric Conditions - Story</div>', unsafe_allow_html=True)
+else:
+    st.markdown('<div class="main-header">气候与大气条件数据故事仪表板</div>', unsafe_allow_html=True)
+
+dataset_info = get_dataset_info()
+st.caption(f"{'Data source' if st.session_state.lang == 'en' else '数据来源'}: {dataset_info['name']}")
+
+# 介绍页不需要数据，先于数据加载渲染
+if page == "介绍":
+    render_page(page, st.session_state.lang)
+
+# 加载数据：首次加载在后台线程中进行，完成前概览页按已就绪的部分逐步渲染，
+# 每发布一个阶段（或等待超时）就重新运行脚本
+loader = perf.lazy_import("utils.loader")
+progress = loader.start_loading()
+if not progress.done:
+    seen = progress.version
+    with st.sidebar:
+        st.progress(progress.fraction(), text="正在加载和预处理数据..." if st.session_state.lang == 'zh'
+                    else "Loading and preprocessing data...")
+    if page == "概览":
+        render_page(page, None, progress.tables(), {}, st.session_state.lang, loading=True)
+    elif page != "介绍":
+        st.info("正在加载数据，请稍候..." if st.session_state.lang == 'zh' else "Loading data, please wait...")
+    progress.wait(seen, LOAD_POLL_SECONDS)
+    st.rerun()
+
+if progress.error is not None:
+    st.error(f"数据加载失败: {progress.error}")
+    if st.button("重试" if st.session_state.lang == 'zh' else "Retry"):
+        loader.start_loading(retry=True)
+        st.rerun()
+    st.stop()
+
+dataset = loader.get_processed_data()
+
+if dataset is None:
+    st.error("数据加载失败，请检查数据文件")
+    st.stop()
+
+df_clean, tables, meta = dataset.df, dataset.tables, dataset.meta
+
+# 侧边栏中依赖数据的部分
+with st.sidebar:
     # 数据信息 / Data info
     st.subheader("数据信息" if st.session_state.lang == 'zh' else "Data information")
     st.success("数据加载成功" if st.session_state.lang == 'zh' else "Data loaded successfully")
     
     with st.expander("数据详情" if st.session_state.lang == 'zh' else "Dataset details"):
-        st.write(("**总记录数**" if st.session_state.lang == 'zh' else "**Total records**") + f": {len(df_clean):,}")
-        st.write(("**总列数**" if st.session_state.lang == 'zh' else "**Total columns**") + f": {len(df_clean.columns)}")
+        st.write(("**总记录数**" if st.session_state.lang == 'zh' else "**Total records**") + f": {meta.rows:,}")
+        st.write(("**总列数**" if st.session_state.lang == 'zh' else "**Total columns**") + f": {len(meta.columns)}")
         
-        if 'date' in df_clean.columns:
-            min_date = df_clean['date'].min()
-            max_date = df_clean['date'].max()
+        if meta.date_min is not None:
+            min_date = meta.date_min
+            max_date = meta.date_max
             if st.session_state.lang == 'zh':
                 st.write(f"**日期范围**: {min_date.strftime('%Y-%m-%d')} 至 {max_date.strftime('%Y-%m-%d')}")
             else:
                 st.write(f"**Date range**: {min_date.strftime('%Y-%m-%d')} to {max_date.strftime('%Y-%m-%d')}")
+
+        memory_mb = meta.memory_bytes / 1024 ** 2
+        saved_mb = meta.memory_saved / 1024 ** 2
+        if st.session_state.lang == 'zh':
+            st.write(f"**内存占用**: {memory_mb:.1f} MB（类型压缩节省 {saved_mb:.1f} MB）")
+        else:
+            st.write(f"**Memory**: {memory_mb:.1f} MB (dtype compaction saved {saved_mb:.1f} MB)")
     
     st.markdown("---")
     
@@ -146,29 +190,25 @@ with st.sidebar:
     st.subheader("过滤器" if st.session_state.lang == 'zh' else "Filters")
     filters = {}
     
-    # 日期范围过滤器
-    if 'date' in df_clean.columns:
-        df_clean['date'] = pd.to_datetime(df_clean['date'], errors='coerce')
-        df_dates = df_clean['date'].dropna()
+    # 日期范围过滤器（日期边界来自加载时计算的元信息，不扫描数据）
+    if meta.date_min is not None:
+        min_date = meta.date_min.date()
+        max_date = meta.date_max.date()
         
-        if len(df_dates) > 0:
-            min_date = df_dates.min().date()
-            max_date = df_dates.max().date()
+        if min_date < max_date:
+            date_range = st.date_input(
+                ("日期范围" if st.session_state.lang == 'zh' else "Date range"),
+                value=(min_date, max_date),
+                min_value=min_date,
+                max_value=max_date,
+                key="date_filter"
+            )
             
-            if min_date < max_date:
-                date_range = st.date_input(
-                    ("日期范围" if st.session_state.lang == 'zh' else "Date range"),
-                    value=(min_date, max_date),
-                    min_value=min_date,
-                    max_value=max_date,
-                    key="date_filter"
-                )
-                
-                if isinstance(date_range, tuple) and len(date_range) == 2:
-                    filters['date_range'] = date_range
-                elif isinstance(date_range, date):
-                    filters['date_range'] = (date_range, max_date)
-    
+            if isinstance(date_range, tuple) and len(date_range) == 2:
+                filters['date_range'] = date_range
+            elif isinstance(date_range, date):
+                filters['date_range'] = (date_range, max_date)
+
     st.markdown("---")
     
     # 应用信息
@@ -178,24 +218,48 @@ with st.sidebar:
     if st.button("重置过滤器" if st.session_state.lang == 'zh' else "Reset filters"):
         st.rerun()
 
-# 在侧边栏渲染之后再显示标题和数据来源，确保语言选择先被处理
-if st.session_state.lang == 'en':
-    st.markdown('<div class="main-header">Climate and Atmospheric Conditions - Story</div>', unsafe_allow_html=True)
-else:
-    st.markdown('<div class="main-header">气候与大气条件数据故事仪表板</div>', unsafe_allow_html=True)
+    show_perf = st.checkbox("性能分析" if st.session_state.lang == 'zh' else "Performance", key="perf_panel")
 
-dataset_info = get_dataset_info()
-st.caption(f"{'Data source' if st.session_state.lang == 'en' else '数据来源'}: {dataset_info['name']}")
+# 主内容区域：各页面共享同一个过滤后的视图
+if page != "介绍":
+    from utils.view import filter_tables, filter_view
+    df_view = filter_view(df_clean, filters)
+    tables_view = filter_tables(tables, filters)
+    render_page(page, df_view, tables_view, filters, st.session_state.lang)
 
-# 主内容区域
-if page == "介绍":
-    intro.render(st.session_state.lang)
-elif page == "概览":
-    overview.render(df_clean, tables, filters, st.session_state.lang)
-elif page == "深入分析":
-    deep_dives.render(df_clean, tables, filters, st.session_state.lang)
-elif page == "结论":
-    conclusions.render(df_clean, tables, filters, st.session_state.lang)
+# 性能面板（可选）：在页面渲染之后显示，包含本次运行的耗时
+if show_perf:
+    import pandas as pd
+    zh = st.session_state.lang == 'zh'
+    with st.sidebar.expander("性能" if zh else "Performance", expanded=True):
+        tracing = st.checkbox("统计内存（较慢）" if zh else "Track memory (slower)", value=perf.memory_tracing(), key="perf_memory")
+        perf.set_memory_tracing(tracing)
+
+        stats = perf.snapshot()
+        if stats['spans']:
+            spans = pd.DataFrame.from_dict(stats['spans'], orient='index')
+            spans_view = pd.DataFrame({
+                ('调用' if zh else 'Calls'): spans['calls'],
+                ('累计 s' if zh else 'Total s'): spans['seconds'].round(3),
+                ('平均 ms' if zh else 'Mean ms'): (spans['seconds'] / spans['calls'] * 1000).round(1),
+                ('最大 ms' if zh else 'Max ms'): (spans['max_seconds'] * 1000).round(1),
+                ('最近 ms' if zh else 'Last ms'): (spans['last_seconds'] * 1000).round(1),
+                ('内存峰值 MB' if zh else 'Peak MB'): (spans['memory_peak_bytes'].astype(float) / 1024 ** 2).round(1),
+            }).sort_values('累计 s' if zh else 'Total s', ascending=False)
+            st.dataframe(spans_view, use_container_width=True)
+
+        if stats['caches']:
+            caches = pd.DataFrame.from_dict(stats['caches'], orient='index')
+            caches[('命中率' if zh else 'Hit rate')] = (caches['hits'] / (caches['hits'] + caches['misses'])).round(3)
+            st.dataframe(caches, use_container_width=True)
+
+        st.download_button("导出日志 (JSON Lines)" if zh else "Export log (JSON Lines)",
+                           perf.export_json_lines(), file_name="perf.jsonl", mime="application/x-ndjson")
+        st.download_button("导出指标 (Prometheus)" if zh else "Export metrics (Prometheus)",
+                           perf.export_prometheus(), file_name="metrics.prom", mime="text/plain")
+        if st.button("清空统计" if zh else "Reset statistics", key="perf_reset"):
+            perf.reset()
+            st.rerun()
 
 # 页脚
 st.markdown("---")
@@ -0,0 +1,355 @@
+"""
+数据管道基准测试
+在合成数据上测量 加载 → 清洗 → 聚合 → 绘图 各阶段的耗时、峰值内存和图表JSON大小，
+结果以JSON输出，可与上一版本的结果比较以发现性能回退
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.io as pio
+import pyarrow as pa
+import streamlit as st
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.generate_data import generate_csv
+from utils.io import ingest_cache_path, load_dataset
+from utils.prep import (
+    calculate_kpis, clean_data, conform_categories, make_tables, partial_tables, validate_data,
+)
+from utils.cube import build_kpi_cube
+from utils.engine import BACKENDS, get_backend
+from utils.figcache import figure_cache
+from utils.view import set_view_key
+from utils.viz import bar_chart, box_plot, correlation_heatmap, distribution_chart, line_chart
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+# 比较结果时，耗时超过基线的该倍数视为回退
+DEFAULT_TOLERANCE = 1.25
+# 测量冷导入耗时的模块：数据管道和各页面（启动时按需导入）
+IMPORT_MODULES = ['utils.loader', 'utils.viz', 'sections.intro', 'sections.overview',
+                  'sections.deep_dives', 'sections.conclusions']
+
+def _max_rss_bytes():
+    """进程的常驻内存峰值（不支持的平台返回 None）"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+class Recorder:
+    """记录各阶段的耗时和 tracemalloc 峰值内存
+
+    tracemalloc 会显著拖慢 Python 层代码，因此每个阶段先在跟踪下运行一次
+    只取峰值内存，再在不跟踪时运行一次计时（--no-trace 时只计时）。
+    tracemalloc 统计 Python 和 NumPy 的分配，不包括 Arrow 内存池，
+    Arrow 部分单独记录为 arrow_bytes。setup 在每次运行前调用，用于恢复冷启动状态。
+    """
+
+    def __init__(self, trace=True):
+        self.trace = trace
+        self.stages = []
+
+    def run(self, name, func, *args, setup=None, **kwargs):
+        peak = None
+        if self.trace:
+            if setup is not None:
+                setup()
+            tracemalloc.start()
+            try:
+                func(*args, **kwargs)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+
+        self.stages.append({
+            'stage': name,
+            'seconds': round(seconds, 6),
+            'peak_bytes': peak,
+            'arrow_bytes': pa.total_allocated_bytes(),
+        })
+        return result
+
+    def figure(self, name, build, *args, **kwargs):
+        """构建图表并记录JSON大小，再记录命中图表缓存时的耗时
+
+        构建阶段每次运行前清空图表缓存和视图缓存，测量的是未命中时的
+        构建加序列化（序列化已在构建时完成，json_seconds 只是读取缓存的 JSON）。
+        命中阶段另记 encode_seconds：st.plotly_chart 每次渲染都要把图表
+        转为字典再编码为 JSON，命中缓存时这部分开销仍然存在。
+        """
+        def clear_caches():
+            figure_cache().clear()
+            st.cache_data.clear()
+
+        fig = self.run(f'figure.{name}', build, *args, setup=clear_caches, **kwargs)
+        start = time.perf_counter()
+        payload = fig.to_json()
+        self.stages[-1]['json_bytes'] = len(payload.encode('utf-8'))
+        self.stages[-1]['json_seconds'] = round(time.perf_counter() - start, 6)
+        cached = self.run(f'figure.{name}.cached', build, *args, **kwargs)
+        start = time.perf_counter()
+        pio.to_json(cached.to_dict(), validate=False)
+        self.stages[-1]['encode_seconds'] = round(time.perf_counter() - start, 6)
+        return fig
+
+def table_mismatches(expected, actual):
+    """两组聚合表中取值不同的单元格数（NaN 与 NaN 视为相同），表或列不一致时计为整张表"""
+    mismatched = 0
+    for name in expected.keys() | actual.keys():
+        left, right = expected.get(name), actual.get(name)
+        if left is None or right is None or list(left.columns) != list(right.columns) or len(left) != len(right):
+            mismatched += max(len(left) if left is not None else 0, len(right) if right is not None else 0)
+            continue
+        for col in left.columns:
+            a, b = left[col], right[col]
+            same = (a.to_numpy() == b.to_numpy()) | (a.isna().to_numpy() & b.isna().to_numpy())
+            mismatched += int((~same).sum())
+    return mismatched
+
+def lost_values(before, after):
+    """转换前后各列非空值数量的减少量之和（如新类别在统一分类类型时变为缺失值）"""
+    return int((before.notna().sum() - after.reindex(columns=before.columns).notna().sum()).clip(lower=0).sum())
+
+def bench_pipeline(rows, work_dir, trace=True, seed=0, jobs=None):
+    """在 rows 行合成数据上运行一次完整管道，返回该次运行的结果
+
+    jobs 大于 1 时另外测量按行分片的多进程 make_tables（make_tables.parallel），
+    并记录其结果与串行结果不同的单元格数（mismatched_cells，应为 0）。
+    append.conform 按应用的追加路径把末尾 1% 的行（其中一行为未出现过的天气类型）
+    单独清洗后对齐到已有数据，并记录丢失的非空值数（lost_values，应为 0）。
+    """
+    data_dir = Path(work_dir) / f"rows_{rows}"
+    csv_path = data_dir / "weather.csv"
+    rec = Recorder(trace)
+
+    # 数据生成不属于被测管道，不计入各阶段
+    start = time.perf_counter()
+    file_bytes = generate_csv(csv_path, rows, seed=seed)
+    generate_seconds = time.perf_counter() - start
+
+    def drop_ingest_cache():
+        ingest_cache_path(csv_path).unlink(missing_ok=True)
+
+    try:
+        # 直接测量未缓存的整体加载（首次读取写入列式缓存，第二次读取命中缓存）
+        raw = rec.run('load.cold', load_dataset, data_dir, setup=drop_ingest_cache)
+        del raw
+        raw = rec.run('load.warm', load_dataset, data_dir)
+    finally:
+        drop_ingest_cache()
+
+    # 追加的新块单独清洗（行数少时分类列仍是字符串），其中一行为已有数据中没有的类别
+    appended = max(1, rows // 100)
+    new_raw = raw.iloc[-appended:].copy()
+    new_raw.loc[new_raw.index[0], 'Weather'] = 'Unseen Weather'
+    df = rec.run('clean_data', clean_data, raw)
+    del raw
+    new_rows = clean_data(new_raw, inplace=True)
+    conformed = rec.run('append.conform', conform_categories, new_rows, df.iloc[:len(df) - appended])
+    rec.stages[-1]['lost_values'] = lost_values(new_rows, conformed)
+    del new_raw, new_rows, conformed
+    tables = rec.run('make_tables', make_tables, df)
+    if jobs and jobs > 1:
+        # tracemalloc 只统计主进程，工作进程的内存不计入峰值
+        parallel = rec.run('make_tables.parallel', make_tables, df, jobs=jobs)
+        rec.stages[-1]['mismatched_cells'] = table_mismatches(tables, parallel)
+        del parallel
+    cube = rec.run('build_kpi_cube', lambda: build_kpi_cube(partial_tables(df)))
+
+    dates = df['date'].dropna()
+    start_day, end_day = dates.min().date(), dates.max().date()
+    mid_day = (start_day + (end_day - start_day) / 2)
+    filters = {'date_range': (start_day, mid_day)}
+    rec.run('calculate_kpis.scan', calculate_kpis, df)
+    rec.run('calculate_kpis.scan_filtered', calculate_kpis, df, filters)
+    rec.run('calculate_kpis.cube_filtered', calculate_kpis, df, filters, cube)
+    rec.run('validate_data', validate_data, df)
+
+    # 执行后端（见 utils.engine）：都从数据文件开始计算，每次运行前删除 Arrow 摄取缓存，
+    # 两个后端都需要解析 CSV
+    for name in BACKENDS:
+        backend = get_backend(name)
+        rec.run(f'backend.{name}.make_tables', backend.make_tables, data_dir, setup=drop_ingest_cache)
+        rec.run(f'backend.{name}.calculate_kpis_filtered', backend.calculate_kpis, data_dir, filters,
+                setup=drop_ingest_cache)
+        rec.run(f'backend.{name}.validate_data', backend.validate_data, data_dir, setup=drop_ingest_cache)
+    drop_ingest_cache()
+
+    # 与应用一致：完整数据集带视图键，图表可按数据指纹缓存
+    set_view_key(df, f"bench-{rows}-{seed}")
+    rec.figure('line_chart.daily', line_chart, tables['timeseries'], 'date',
+               ['temperature', 'dew_point', 'humidity'], title="daily")
+    rec.figure('line_chart.hourly', line_chart, df, 'date', ['temperature'], title="hourly")
+    if 'by_weather' in tables:
+        rec.figure('bar_chart', bar_chart, tables['by_weather'], 'weather', 'temperature')
+    rec.figure('distribution_chart', distribution_chart, df, 'temperature')
+    rec.figure('box_plot', box_plot, df, 'weather', 'temperature', top_n=10)
+    rec.figure('correlation_heatmap', correlation_heatmap, df)
+
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return {
+        'rows': rows,
+        'file_bytes': file_bytes,
+        'generate_seconds': round(generate_seconds, 6),
+        'clean_bytes': int(df.memory_usage(deep=True).sum()),
+        'max_rss_bytes': _max_rss_bytes(),
+        'stages': rec.stages,
+    }
+
+def _git_commit():
+    """当前代码的提交号（不在 git 仓库中时返回 None）"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    """记录运行环境，便于解释不同结果之间的差异"""
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'platform': platform.platform(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'pyarrow': pa.__version__,
+        'plotly': plotly.__version__,
+    }
+
+def import_times(modules=IMPORT_MODULES, repeat=3):
+    """在全新的解释器中测量各模块的冷导入耗时，返回阶段列表
+
+    每个模块单独启动进程，先导入 streamlit（每个工作进程都会导入），
+    只计其后的增量，取 repeat 次的中位数。
+    """
+    root = Path(__file__).resolve().parent.parent
+    stages = []
+    for module in modules:
+        code = ("import time, streamlit; start = time.perf_counter(); "
+                f"import {module}; print(time.perf_counter() - start)")
+        samples = sorted(
+            float(subprocess.run([sys.executable, '-c', code], cwd=root, check=True,
+                                 capture_output=True, text=True).stdout.split()[-1])
+            for _ in range(repeat)
+        )
+        stages.append({'stage': f'import.{module}', 'seconds': round(samples[len(samples) // 2], 6)})
+    return stages
+
+def _regressions(stages, base_stages, tolerance, rows=None):
+    base_stages = {stage['stage']: stage for stage in base_stages}
+    regressions = []
+    for stage in stages:
+        base = base_stages.get(stage['stage'])
+        if base is None or base['seconds'] <= 0:
+            continue
+        ratio = stage['seconds'] / base['seconds']
+        if ratio > tolerance:
+            regressions.append({
+                'rows': rows,
+                'stage': stage['stage'],
+                'seconds': stage['seconds'],
+                'baseline_seconds': base['seconds'],
+                'ratio': round(ratio, 3),
+            })
+    return regressions
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """与基线结果逐阶段比较耗时（含冷导入耗时），返回超过容差的回退列表"""
+    baseline_runs = {run['rows']: run for run in baseline.get('runs', [])}
+    regressions = _regressions(results.get('imports', []), baseline.get('imports', []), tolerance)
+    for run in results['runs']:
+        base_run = baseline_runs.get(run['rows'])
+        if base_run is not None:
+            regressions.extend(_regressions(run['stages'], base_run['stages'], tolerance, run['rows']))
+    return regressions
+
+def _json_default(value):
+    """把 NumPy 标量和日期转换为JSON可序列化的类型"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (date, pd.Timestamp)):
+        return value.isoformat()
+    raise TypeError(f"无法序列化类型 {type(value).__name__}")
+
+def main():
+    parser = argparse.ArgumentParser(description="测量数据管道各阶段的耗时、峰值内存和图表大小")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="合成数据行数（可指定多个，范围 1万 至 5000万）")
+    parser.add_argument("--output", type=Path, help="结果JSON路径（默认输出到标准输出）")
+    parser.add_argument("--compare", type=Path, help="基线结果JSON，存在回退时以状态码 1 退出")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许的耗时倍数")
+    parser.add_argument("--work-dir", type=Path, help="临时数据目录（默认使用系统临时目录）")
+    parser.add_argument("--no-trace", action="store_true", help="关闭 tracemalloc，只测耗时")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="make_tables.parallel 使用的进程数（默认为 CPU 核数，1 表示跳过）")
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="climate-bench-", dir=args.work_dir))
+    try:
+        runs = []
+        for rows in args.rows:
+            print(f"运行 {rows:,} 行...", file=sys.stderr)
+            runs.append(bench_pipeline(rows, work_dir, trace=not args.no_trace, seed=args.seed, jobs=args.jobs))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("测量冷导入耗时...", file=sys.stderr)
+    results = {'environment': environment(), 'trace': not args.no_trace, 'imports': import_times(), 'runs': runs}
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding='utf-8'))
+        results['regressions'] = compare(results, baseline, args.tolerance)
+
+    payload = json.dumps(results, indent=2, ensure_ascii=False, default=_json_default)
+    if args.output:
+        args.output.write_text(payload, encoding='utf-8')
+    else:
+        print(payload)
+
+    mismatches = [(run['rows'], stage['stage'], stage['mismatched_cells']) for run in runs
+                  for stage in run['stages'] if stage.get('mismatched_cells')]
+    for rows, stage, cells in mismatches:
+        print(f"结果不一致: {rows:,} 行 {stage} 与串行结果有 {cells} 个单元格不同", file=sys.stderr)
+    losses = [(run['rows'], stage['stage'], stage['lost_values']) for run in runs
+              for stage in run['stages'] if stage.get('lost_values')]
+    for rows, stage, values in losses:
+        print(f"数据丢失: {rows:,} 行 {stage} 有 {values} 个非空值变为缺失值", file=sys.stderr)
+
+    if results.get('regressions'):
+        for item in results['regressions']:
+            # 冷导入阶段与数据行数无关（rows 为 None）
+            rows = f"{item['rows']:,} 行" if item['rows'] is not None else "-"
+            print(f"回退: {rows} {item['stage']} "
+                  f"{item['baseline_seconds']:.3f}s → {item['seconds']:.3f}s (×{item['ratio']})", file=sys.stderr)
+        sys.exit(1)
+    if mismatches or losses:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+离线预计算
+在部署或数据更新后运行，提前生成仪表板所需的全部产物，Web 进程启动时只做内存映射
+
+    python precompute.py                # 数据未变化时直接跳过
+    python precompute.py --force --jobs 4
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from utils.artifacts import MANIFEST, build_artifacts
+from utils.io import DATA_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description="预计算仪表板数据产物")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="数据目录（默认 data/）")
+    parser.add_argument("--jobs", type=int, default=None, help="并行处理的进程数（默认为 CPU 核数）")
+    parser.add_argument("--force", action="store_true", help="产物已是最新时也重新构建")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        path, built = build_artifacts(args.data_dir, jobs=args.jobs, force=args.force)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+
+    manifest = json.loads((path / MANIFEST).read_text(encoding="utf-8"))
+    status = "已生成" if built else "已是最新"
+    print(f"{status}: {path}（{manifest['rows']:,} 行，{time.perf_counter() - start:.1f}s）")
+    for name, size in manifest["files"].items():
+        print(f"  {name}: {size / 1e6:.1f} MB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
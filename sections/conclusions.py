@@ -4,7 +4,9 @@
 import streamlit as st
 import pandas as pd
 from utils.prep import validate_data
+from utils.perf import timed
 
+@timed
 def render(df, tables, filters, lang: str = 'zh'):
     if lang == 'en':
         st.header("Key insights & recommendations")
@@ -13,7 +15,7 @@ def render(df, tables, filters, lang: str = 'zh'):
         st.header("关键洞察与启示")
         st.subheader("数据质量报告")
 
-    quality_report = validate_data(df)
+    quality_report = validate_data(df, profile=tables.get('profile'))
 
     col1, col2, col3 = st.columns(3)
 
@@ -47,6 +49,18 @@ def render(df, tables, filters, lang: str = 'zh'):
         if len(missing_df) > 0:
             st.dataframe(missing_df, use_container_width=True)
 
+    with st.expander("Column profile" if lang == 'en' else "列画像"):
+        profile_df = pd.DataFrame({
+            ('Column' if lang == 'en' else '列名'): list(quality_report.get('dtypes', {}).keys()),
+            ('Type' if lang == 'en' else '类型'): list(quality_report.get('dtypes', {}).values()),
+            ('Distinct values' if lang == 'en' else '不同值数量'): list(quality_report.get('cardinality', {}).values()),
+            ('Min' if lang == 'en' else '最小值'): [str(v) if v is not None else '' for v in quality_report.get('min', {}).values()],
+            ('Max' if lang == 'en' else '最大值'): [str(v) if v is not None else '' for v in quality_report.get('max', {}).values()],
+        })
+
+        if len(profile_df) > 0:
+            st.dataframe(profile_df, use_container_width=True)
+
     if lang == 'en':
         st.subheader("Key insights summary")
         st.markdown("""
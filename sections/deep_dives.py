@@ -4,8 +4,12 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from utils.viz import distribution_chart, box_plot, correlation_heatmap
+from utils.viz import distribution_chart, box_plot, correlation_heatmap, show_chart
+from utils.prep import describe_column
+from utils.corr import comoments, correlation_matrix, strongest_correlation
+from utils.perf import timed
 
+@timed
 def render(df, tables, filters, lang: str = 'zh'):
     if lang == 'en':
         st.header("Deep Dives")
@@ -24,11 +28,11 @@ def render(df, tables, filters, lang: str = 'zh'):
 
         with col1:
             fig_dist = distribution_chart(df, selected_var, title=(f"{selected_var} distribution histogram" if lang == 'en' else f"{selected_var} 分布直方图"))
-            st.plotly_chart(fig_dist, use_container_width=True)
+            show_chart(fig_dist, use_container_width=True)
 
         with col2:
             st.markdown("### Statistical summary" if lang == 'en' else "### 统计摘要")
-            stats = df[selected_var].describe()
+            stats = describe_column(df, selected_var)
             st.metric("Mean" if lang == 'en' else "均值", f"{stats['mean']:.2f}")
             st.metric("Median" if lang == 'en' else "中位数", f"{stats['50%']:.2f}")
             st.metric("Std dev" if lang == 'en' else "标准差", f"{stats['std']:.2f}")
@@ -44,18 +48,15 @@ def render(df, tables, filters, lang: str = 'zh'):
             value_var = st.selectbox("Select numeric variable" if lang == 'en' else "选择数值变量", numeric_cols, key="box_value")
         
         if value_var:
-            # 限制天气类型数量
-            weather_counts = df['weather'].value_counts()
-            top_weathers = weather_counts.head(10).index
-            df_filtered = df[df['weather'].isin(top_weathers)]
-            
+            # 限制天气类型数量（前10种），统计量在服务端计算并缓存
             fig_box = box_plot(
-                df_filtered,
+                df,
                 'weather',
                 value_var,
-                title=(f"{value_var} grouped by weather type" if lang == 'en' else f"{value_var} 按天气类型分组比较")
+                title=(f"{value_var} grouped by weather type" if lang == 'en' else f"{value_var} 按天气类型分组比较"),
+                top_n=10
             )
-            st.plotly_chart(fig_box, use_container_width=True)
+            show_chart(fig_box, use_container_width=True)
     
     # 相关性分析
     if len(numeric_cols) > 1:
@@ -68,31 +69,32 @@ def render(df, tables, filters, lang: str = 'zh'):
             key="corr_vars"
         )
         
+        pairwise = st.checkbox(
+            "Pairwise-complete (use all rows where each pair is present)" if lang == 'en' else "成对完整（每对变量各自使用两者都非空的行）",
+            value=False,
+            key="corr_pairwise"
+        )
+        
         if len(selected_vars) > 1:
-            df_corr = df[selected_vars].dropna()
+            # 相关矩阵由缓存的共矩和直接得到，不再复制和扫描数据
+            corr_matrix = correlation_matrix(comoments(df), selected_vars, pairwise=pairwise)
             
-            if len(df_corr) > 0:
-                fig_corr = correlation_heatmap(df_corr, title=("Variable correlation matrix" if lang == 'en' else "变量相关性矩阵"))
-                st.plotly_chart(fig_corr, use_container_width=True)
+            if corr_matrix.notna().to_numpy().any():
+                fig_corr = correlation_heatmap(df, title=("Variable correlation matrix" if lang == 'en' else "变量相关性矩阵"), corr_matrix=corr_matrix)
+                show_chart(fig_corr, use_container_width=True)
                 
                 # 找出最强相关性
-                corr_matrix = df_corr.corr()
-                corr_matrix = corr_matrix.where(
-                    np.triu(np.ones(corr_matrix.shape), k=1).astype(bool)
-                )
+                strongest = strongest_correlation(corr_matrix)
                 
-                max_corr = corr_matrix.max().max()
-                min_corr = corr_matrix.min().min()
-                
-                if abs(max_corr) > abs(min_corr):
-                    pair = corr_matrix.stack().idxmax()
-                    if lang == 'en':
-                        st.success(f"**Strongest positive correlation**: {pair[0]} and {pair[1]} (r = {max_corr:.3f})")
-                    else:
-                        st.success(f"**最强正相关**：{pair[0]} 和 {pair[1]} (r = {max_corr:.3f})")
-                else:
-                    pair = corr_matrix.stack().idxmin()
-                    if lang == 'en':
-                        st.info(f"**Strongest negative correlation**: {pair[0]} and {pair[1]} (r = {min_corr:.3f})")
+                if strongest is not None:
+                    var_a, var_b, r = strongest
+                    if r > 0:
+                        if lang == 'en':
+                            st.success(f"**Strongest positive correlation**: {var_a} and {var_b} (r = {r:.3f})")
+                        else:
+                            st.success(f"**最强正相关**：{var_a} 和 {var_b} (r = {r:.3f})")
                     else:
-                        st.info(f"**最强负相关**：{pair[0]} 和 {pair[1]} (r = {min_corr:.3f})")
+                        if lang == 'en':
+                            st.info(f"**Strongest negative correlation**: {var_a} and {var_b} (r = {r:.3f})")
+                        else:
+                            st.info(f"**最强负相关**：{var_a} 和 {var_b} (r = {r:.3f})")
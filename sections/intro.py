@@ -2,8 +2,10 @@
 介绍页面
 """
 import streamlit as st
-from utils.io import get_dataset_info
+from utils.info import get_dataset_info
+from utils.perf import timed
 
+@timed
 def render(lang: str = 'zh'):
     if lang == 'en':
         st.header("Climate and Atmospheric Conditions - Story")
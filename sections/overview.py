@@ -3,22 +3,57 @@
 """
 import streamlit as st
 import pandas as pd
-from utils.viz import line_chart, bar_chart
+from utils.viz import line_chart, bar_chart, show_chart
 from utils.prep import calculate_kpis
+from utils.perf import timed
+from utils.resample import GRANULARITIES, REDUCERS, auto_granularity, resample
+from utils.anomaly import DEFAULT_THRESHOLD, DEFAULT_WINDOW, detect_anomalies
+from utils.view import date_span
 
-def render(df, tables, filters, lang: str = 'zh'):
+GRANULARITY_LABELS = {
+    'zh': {'auto': '自动', 'hour': '小时', 'day': '日', 'week': '周', 'month': '月', 'year': '年'},
+    'en': {'auto': 'Auto', 'hour': 'Hourly', 'day': 'Daily', 'week': 'Weekly', 'month': 'Monthly', 'year': 'Yearly'},
+}
+REDUCER_LABELS = {
+    'zh': {'mean': '均值', 'min': '最小值', 'max': '最大值', 'std': '标准差', 'count': '计数'},
+    'en': {'mean': 'Mean', 'min': 'Min', 'max': 'Max', 'std': 'Std. dev.', 'count': 'Count'},
+}
+
+def _reducer_label(reducer, lang):
+    if reducer.startswith('p'):
+        return f"P{reducer[1:]}" if lang == 'en' else f"{reducer[1:]}% 分位数"
+    return REDUCER_LABELS[lang][reducer]
+
+def _placeholder(lang):
+    """数据尚未就绪的部分显示的占位"""
+    st.info("Loading..." if lang == 'en' else "正在加载...")
+
+@timed
+def render(df, tables, filters, lang: str = 'zh', loading: bool = False):
+    """渲染概览页
+
+    loading=True 表示数据仍在后台加载：df 为 None，tables 只包含已就绪的表，
+    各部分在数据到达前显示占位，依赖逐小时数据的控件暂不可用。
+    """
     if lang == 'en':
         st.header("Data Overview")
     else:
         st.header("数据概览")
     
-    kpis = calculate_kpis(df, filters)
-    
     if lang == 'en':
         st.subheader("Key metrics")
     else:
         st.subheader("关键指标")
 
+    if loading and 'kpi_cube' not in tables:
+        _placeholder(lang)
+    else:
+        _render_kpis(calculate_kpis(df, filters, cube=tables.get('kpi_cube')), lang)
+
+    _render_timeseries(df, tables, lang, loading)
+    _render_weather(tables, lang, loading)
+
+def _render_kpis(kpis, lang):
     col1, col2, c3, c4 = st.columns(4)
     
     with col1:
@@ -35,9 +70,13 @@ def render(df, tables, filters, lang: str = 'zh'):
     
     with c4:
         st.metric("Total records" if lang == 'en' else "总记录数", f"{kpis.get('total_records', 0):,}")
-    
-    # 时间趋势
-    if 'timeseries' in tables and len(tables['timeseries']) > 0:
+
+def _render_timeseries(df, tables, lang, loading):
+    """时间趋势"""
+    if loading and 'timeseries' not in tables:
+        st.subheader("Time series analysis" if lang == 'en' else "时间趋势分析")
+        _placeholder(lang)
+    elif 'timeseries' in tables and len(tables['timeseries']) > 0:
         st.subheader("Time series analysis" if lang == 'en' else "时间趋势分析")
         
 
@@ -68,19 +107,115 @@ def render(df, tables, filters, lang: str = 'zh'):
                 key="timeseries_vars"
             )
             
+            labels = GRANULARITY_LABELS[lang]
+            col_granularity, col_reducer = st.columns(2)
+            with col_granularity:
+                granularity = st.selectbox(
+                    "Granularity" if lang == 'en' else "时间粒度",
+                    ['auto', *GRANULARITIES],
+                    format_func=labels.get,
+                    key="timeseries_granularity",
+                    disabled=loading
+                )
+            with col_reducer:
+                reducer = st.selectbox(
+                    "Statistic" if lang == 'en' else "统计量",
+                    REDUCERS,
+                    format_func=lambda r: _reducer_label(r, lang),
+                    key="timeseries_reducer",
+                    disabled=loading
+                )
+
+            col_anomaly, col_threshold = st.columns(2)
+            with col_anomaly:
+                show_anomalies = st.checkbox(
+                    "Highlight anomalies" if lang == 'en' else "标出异常点",
+                    key="timeseries_anomalies",
+                    disabled=loading
+                ) and not loading
+            with col_threshold:
+                threshold = st.slider(
+                    "Anomaly threshold (|z|)" if lang == 'en' else "异常阈值（|z|）",
+                    2.0, 6.0, DEFAULT_THRESHOLD, 0.5,
+                    key="timeseries_anomaly_threshold",
+                    disabled=not show_anomalies
+                )
+
             if selected_vars:
+                # 框选缩放：只对选中范围重采样，自动粒度随范围变细，得到更高分辨率的局部图
+                # 加载期间只有按日均值表，缩放在数据就绪后生效
+                zoom = None if loading else st.session_state.get('timeseries_zoom')
+                span = None if loading else date_span(df)
+                if span is not None:
+                    start, end = zoom if zoom is not None else span
+                    if granularity == 'auto':
+                        granularity = auto_granularity(start, end)
+                    source = resample(df, granularity, tuple(selected_vars), reducer, zoom)
+                else:
+                    granularity, reducer = 'day', 'mean'
+                    source = tables['timeseries']
+                # 异常点在整个视图的逐小时数据上检测（滚动窗口需要缩放范围之前的历史），再截取到缩放范围
+                flags = None
+                if show_anomalies and 'date' in df.columns:
+                    flags = detect_anomalies(df, tuple(selected_vars), threshold)
+                    if zoom is not None:
+                        flags = {col: points[points['date'].between(*zoom)] for col, points in flags.items()}
+                resolution = f"{labels[granularity]} {_reducer_label(reducer, lang)}" if lang == 'en' \
+                    else f"{labels[granularity]}{_reducer_label(reducer, lang)}"
                 fig = line_chart(
-                    tables['timeseries'],
+                    source,
                     'date',
                     selected_vars,
                     title=("Climate variables over time" if lang == 'en' else "气候变量随时间变化趋势"),
                     x_label=("Date" if lang == 'en' else "日期"),
-                    y_label=("Value" if lang == 'en' else "数值")
+                    y_label=("Value" if lang == 'en' else "数值"),
+                    highlights=flags,
+                    highlight_label=("anomaly" if lang == 'en' else "异常")
                 )
-                st.plotly_chart(fig, use_container_width=True)
-    
-    # 天气类型比较
-    if 'by_weather' in tables and len(tables['by_weather']) > 0:
+                event = show_chart(
+                    fig,
+                    use_container_width=True,
+                    key=f"timeseries_chart_{st.session_state.get('timeseries_zoom_gen', 0)}",
+                    on_select="ignore" if loading else "rerun",
+                    selection_mode="box"
+                )
+                boxes = event.selection.get('box') if event and not loading else None
+                if boxes and boxes[-1].get('x'):
+                    box_x = pd.to_datetime(boxes[-1]['x'])
+                    new_zoom = (box_x.min(), box_x.max())
+                    if new_zoom != zoom:
+                        st.session_state['timeseries_zoom'] = new_zoom
+                        st.rerun()
+
+                if flags is not None:
+                    found = {col: len(points) for col, points in flags.items() if len(points)}
+                    if lang == 'en':
+                        st.caption(f"Anomalies (deseasonalised {DEFAULT_WINDOW.days}-day rolling z-score): "
+                                   + (", ".join(f"{col} {n}" for col, n in found.items()) or "none"))
+                    else:
+                        st.caption(f"异常点（去季节后 {DEFAULT_WINDOW.days} 天滚动 z 分数）："
+                                   + ("，".join(f"{col} {n} 个" for col, n in found.items()) or "无"))
+
+                if zoom is not None:
+                    st.caption(
+                        (f"Zoomed to {zoom[0]:%Y-%m-%d %H:%M} – {zoom[1]:%Y-%m-%d %H:%M} ({resolution.lower()})" if lang == 'en'
+                         else f"已放大至 {zoom[0]:%Y-%m-%d %H:%M} – {zoom[1]:%Y-%m-%d %H:%M}（{resolution}）")
+                    )
+                    if st.button("Reset zoom" if lang == 'en' else "重置缩放", key="timeseries_zoom_reset"):
+                        st.session_state.pop('timeseries_zoom', None)
+                        # 更换图表 key 以清除残留的框选状态
+                        st.session_state['timeseries_zoom_gen'] = st.session_state.get('timeseries_zoom_gen', 0) + 1
+                        st.rerun()
+                else:
+                    st.caption(f"{resolution}. Box-select a range on the chart to zoom in" if lang == 'en'
+                               else f"{resolution}。在图上框选一段范围即可放大查看")
+
+def _render_weather(tables, lang, loading):
+    """天气类型比较"""
+    if loading and 'by_weather' not in tables:
+        st.subheader("Weather type analysis" if lang == 'en' else "天气类型分析")
+        _placeholder(lang)
+    elif 'by_weather' in tables and len(tables['by_weather']) > 0:
         st.subheader("Weather type analysis" if lang == 'en' else "天气类型分析")
         
         numeric_cols = [col for col in tables['by_weather'].columns 
@@ -102,4 +237,4 @@ def render(df, tables, filters, lang: str = 'zh'):
                 x_label=("Weather type" if lang == 'en' else "天气类型"),
                 y_label=selected_metric
             )
-            st.plotly_chart(fig, use_container_width=True)
+            show_chart(fig, use_container_width=True)
@@ -0,0 +1,104 @@
+"""
+异常检测模块
+在逐小时序列上计算季节基线和滚动统计量，按 z 分数标记异常点
+"""
+import numpy as np
+import pandas as pd
+from utils.perf import timed
+from utils.view import view_cached
+
+# 默认滚动窗口（当前时刻之前的这段时间，不含当前点）
+DEFAULT_WINDOW = pd.Timedelta(days=7)
+# 季节基线对一年中的每一天向前后各平滑的天数
+SEASONAL_SMOOTHING_DAYS = 7
+DEFAULT_THRESHOLD = 3.0
+# 窗口内有效记录数少于该值时不计算 z 分数
+MIN_PERIODS = 24
+# 每个变量最多返回的异常点数（按 |z| 从大到小保留）
+MAX_FLAGS = 1000
+
+def _day_of_year(dates):
+    """返回一年中的第几天（0–365）"""
+    return (dates.astype('datetime64[D]') - dates.astype('datetime64[Y]')).view(np.int64)
+
+def seasonal_baseline(values, day_of_year, smoothing=SEASONAL_SMOOTHING_DAYS):
+    """按一年中的每一天求多年均值，作为季节基线
+
+    先用 bincount 得到每天的和与计数，再在首尾相接的 366 天上
+    做 ±smoothing 天的滑动平均；没有数据的日子为 NaN。
+    """
+    valid = ~np.isnan(values)
+    sums = np.bincount(day_of_year[valid], weights=values[valid], minlength=366)
+    counts = np.bincount(day_of_year[valid], minlength=366).astype(np.float64)
+
+    width = 2 * smoothing + 1
+    wrapped = np.concatenate([sums[-smoothing:], sums, sums[:smoothing]]) if smoothing else sums
+    wrapped_counts = np.concatenate([counts[-smoothing:], counts, counts[:smoothing]]) if smoothing else counts
+    window_sums = np.convolve(wrapped, np.ones(width), mode='valid')
+    window_counts = np.convolve(wrapped_counts, np.ones(width), mode='valid')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return window_sums / window_counts
+
+def rolling_stats(values, times, window, min_periods=MIN_PERIODS):
+    """计算每个点之前 window 时间内 [t - window, t) 的均值和标准差
+
+    times 为升序的 int64 时间戳。窗口左端用二分查找确定，窗口和与平方和
+    由前缀和相减得到，总代价 O(n log n)，且能正确处理缺测的时段。
+    """
+    valid = ~np.isnan(values)
+    # 前缀和前先减去整体均值，减小平方和相减时的精度损失
+    center = values[valid].mean() if valid.any() else 0.0
+    shifted = np.where(valid, values - center, 0.0)
+
+    csum = np.concatenate(([0.0], np.cumsum(shifted)))
+    csq = np.concatenate(([0.0], np.cumsum(shifted ** 2)))
+    ccount = np.concatenate(([0], np.cumsum(valid)))
+
+    right = np.arange(len(values))
+    left = np.searchsorted(times, times - window, side='left')
+    n = ccount[right] - ccount[left]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (csum[right] - csum[left]) / n
+        variance = ((csq[right] - csq[left]) - n * mean ** 2) / (n - 1)
+        std = np.sqrt(np.maximum(variance, 0.0))
+    enough = n >= max(min_periods, 2)
+    return np.where(enough, mean + center, np.nan), np.where(enough, std, np.nan)
+
+def zscores(values, times, day_of_year, window):
+    """去季节后的 z 分数：当前残差相对于之前窗口内残差的偏离程度"""
+    residual = values - seasonal_baseline(values, day_of_year)[day_of_year]
+    mean, std = rolling_stats(residual, times, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (residual - mean) / std
+    z[~np.isfinite(z)] = np.nan
+    return z
+
+@timed
+@view_cached
+def detect_anomalies(df, columns, threshold=DEFAULT_THRESHOLD, window=DEFAULT_WINDOW):
+    """标记各变量中 |z| 超过阈值的记录
+
+    返回 {列名: 数据框(date, value, zscore)}，每列最多 MAX_FLAGS 个点，按时间排序。
+    要求 df 按 date 升序排列；结果按视图（即筛选的日期范围）和参数缓存。
+    """
+    dates = df['date'].to_numpy()
+    if not df['date'].is_monotonic_increasing:
+        order = np.argsort(dates, kind='stable')
+        df, dates = df.iloc[order], dates[order]
+    # NaT 排在末尾
+    end = int(np.searchsorted(dates, np.datetime64('NaT'), side='left'))
+    dates = dates[:end]
+    times = dates.view(np.int64)
+    unit = np.datetime_data(dates.dtype)[0]
+    window = pd.Timedelta(window).to_timedelta64().astype(f'm8[{unit}]').view(np.int64)
+    day_of_year = _day_of_year(dates)
+
+    flags = {}
+    for col in columns:
+        values = df[col].iloc[:end].to_numpy(dtype=np.float64, na_value=np.nan)
+        z = zscores(values, times, day_of_year, window)
+        hits = np.flatnonzero(np.abs(np.nan_to_num(z)) > threshold)
+        if len(hits) > MAX_FLAGS:
+            hits = np.sort(hits[np.argsort(-np.abs(z[hits]))[:MAX_FLAGS]])
+        flags[col] = pd.DataFrame({'date': dates[hits], 'value': values[hits], 'zscore': z[hits]})
+    return flags
@@ -0,0 +1,130 @@
+"""
+追加缓冲模块
+数据集的各列保存在留有空余容量的数组中，追加的新行写入空余部分，
+得到的新数据框与原数据框共享已有行的内存，追加的代价与新行数成正比
+"""
+import numpy as np
+import pandas as pd
+from utils.perf import timed
+
+# 容量不足时按该倍数扩容：扩容时复制已有行，均摊到每次追加的代价与新行数成正比
+GROWTH = 1.25
+# 扩容时至少预留的行数
+MIN_HEADROOM = 1024
+# 可以直接写入数组的类型：浮点、整数、时间
+_ARRAY_KINDS = 'fiumM'
+
+def _capacity(rows):
+    return max(int(rows * GROWTH), rows + MIN_HEADROOM)
+
+def _codes_dtype(categories):
+    """与 pandas 相同：按类别数选择分类编码的整数类型"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+class _ArrayColumn:
+    """数值或时间列：已有行之后的空余部分可直接写入"""
+
+    def __init__(self, values, capacity):
+        self.buffer = np.empty(capacity, dtype=values.dtype)
+        self.buffer[:len(values)] = values
+
+    def append(self, rows, values):
+        if values.dtype.kind not in _ARRAY_KINDS:
+            return False
+        # 类型提升与 pd.concat 一致（如 int8 与 int16 合并为 int16）
+        dtype = np.result_type(self.buffer.dtype, values.dtype)
+        total = rows + len(values)
+        if dtype != self.buffer.dtype or total > len(self.buffer):
+            # 扩容或提升类型时复制到新数组，旧数据框仍引用原数组
+            buffer = np.empty(max(len(self.buffer), _capacity(total)), dtype=dtype)
+            buffer[:rows] = self.buffer[:rows]
+            self.buffer = buffer
+        self.buffer[rows:total] = values
+        return True
+
+    def series(self, rows, name):
+        return pd.Series(self.buffer[:rows], name=name, copy=False)
+
+class _CategoricalColumn:
+    """无序分类列：编码写入数组，新类别只能追加在已有类别之后（已有编码保持不变）"""
+
+    def __init__(self, series, capacity):
+        self.dtype = series.dtype
+        self.codes = _ArrayColumn(series.cat.codes.to_numpy(), capacity)
+
+    def append(self, rows, series):
+        if not isinstance(series.dtype, pd.CategoricalDtype) or series.dtype.ordered:
+            return False
+        old, new = self.dtype.categories, series.dtype.categories
+        if len(new) < len(old) or not new[:len(old)].equals(old):
+            return False
+        if not self.codes.append(rows, series.cat.codes.to_numpy().astype(_codes_dtype(len(new)))):
+            return False
+        self.dtype = series.dtype
+        return True
+
+    def series(self, rows, name):
+        codes = self.codes.buffer[:rows]
+        return pd.Series(pd.Categorical.from_codes(codes, dtype=self.dtype, validate=False), name=name, copy=False)
+
+class _SeriesColumn:
+    """其他类型的列（如字符串）：追加时拼接，只有这些列的代价与总行数成正比"""
+
+    def __init__(self, series):
+        self.values = series.reset_index(drop=True)
+
+    def append(self, rows, series):
+        self.values = pd.concat([self.values, series], ignore_index=True)
+        return True
+
+    def series(self, rows, name):
+        return self.values.rename(name)
+
+def _column(series, capacity):
+    if isinstance(series.dtype, pd.CategoricalDtype) and not series.dtype.ordered:
+        return _CategoricalColumn(series, capacity)
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in _ARRAY_KINDS:
+        return _ArrayColumn(series.to_numpy(), capacity)
+    return _SeriesColumn(series)
+
+class AppendBuffer:
+    """数据集的追加缓冲
+
+    创建时把 df 复制到留有空余容量的数组中（一次）；append 返回追加新行后的数据框，
+    数值、时间和分类编码列引用同一组数组，之前返回的数据框不受影响。
+    frame 为最近返回的数据框，调用方据此判断缓冲是否仍对应当前数据集。
+    """
+
+    def __init__(self, df, extra=0):
+        capacity = _capacity(len(df) + extra)
+        self.rows = len(df)
+        self.columns = {col: _column(df[col], capacity) for col in df.columns}
+        self.compaction = df.attrs.get('compaction')
+        self.frame = df
+
+    @timed
+    def append(self, new_rows):
+        """追加新行（列与已有数据一致，分类列的类别以已有类别开头），无法追加时返回 None
+
+        返回 None 后缓冲的状态不再可靠，调用方应丢弃它。
+        """
+        if list(new_rows.columns) != list(self.columns):
+            return None
+        for col, column in self.columns.items():
+            if not column.append(self.rows, new_rows[col]):
+                return None
+        self.rows += len(new_rows)
+
+        frame = pd.DataFrame({col: column.series(self.rows, col) for col, column in self.columns.items()}, copy=False)
+        report = new_rows.attrs.get('compaction')
+        if self.compaction and report:
+            self.compaction = {key: self.compaction[key] + report[key] for key in ('before', 'after')}
+        else:
+            self.compaction = None
+        if self.compaction:
+            frame.attrs['compaction'] = dict(self.compaction)
+        self.frame = frame
+        return frame
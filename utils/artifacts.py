@@ -0,0 +1,129 @@
+"""
+预计算产物模块
+离线构建并保存仪表板所需的全部数据（清洗后的列式数据、聚合表、KPI立方体和数据画像），
+应用启动时只需内存映射读取
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import json
+import os
+import pickle
+import shutil
+from utils.cube import build_kpi_cube
+from utils.io import CACHE_DIR, DATA_DIR
+from utils.perf import timed
+from utils.prep import finalize_tables
+from utils.profile import profile_data
+from utils.refresh import load_rows, refresh_tables, state_fingerprint
+from utils.store import map_frame, write_frame
+from utils.view import sort_by_date
+
+ARTIFACT_DIR = CACHE_DIR / "artifacts"
+# 产物格式变化（表结构、立方体或画像字段）时递增，旧版本产物自动失效
+ARTIFACT_VERSION = 2
+MANIFEST = "manifest.json"
+DATA_FILE = "data.arrow"
+TABLES_FILE = "tables.pkl"
+
+def artifact_path(fingerprint, version=ARTIFACT_VERSION):
+    """返回指纹对应的产物目录"""
+    return ARTIFACT_DIR / f"v{version}-{fingerprint}"
+
+def read_manifest(fingerprint):
+    """读取产物清单；不存在、版本或指纹不符时返回 None"""
+    try:
+        with open(artifact_path(fingerprint) / MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != ARTIFACT_VERSION or manifest.get("fingerprint") != fingerprint:
+        return None
+    return manifest
+
+@timed
+def load_artifacts(fingerprint):
+    """读取预计算产物，返回 (数据框, 聚合表)；没有可用产物时返回 None
+
+    数据以内存映射方式打开（与 utils.store 相同，多个进程共享页缓存），
+    聚合表、KPI立方体和数据画像都很小，直接反序列化。
+    """
+    if read_manifest(fingerprint) is None:
+        return None
+    path = artifact_path(fingerprint)
+    try:
+        with open(path / TABLES_FILE, "rb") as f:
+            tables = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    df = map_frame(path / DATA_FILE)
+    if df is None:
+        return None
+    return df, tables
+
+@timed
+def write_artifacts(df, tables, fingerprint, state=None):
+    """写入一组产物并清理其他指纹或版本的旧产物，返回产物目录
+
+    先写到临时目录，全部完成后再改名，读取方要么看到完整的一组产物，要么看不到。
+    """
+    path = artifact_path(fingerprint)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+
+    write_frame(df, tmp_path / DATA_FILE)
+    with open(tmp_path / TABLES_FILE, "wb") as f:
+        pickle.dump(dict(tables), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "fingerprint": fingerprint,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "rows": len(df),
+        "columns": [str(col) for col in df.columns],
+        "tables": sorted(tables),
+        "sources": {key: {"size": entry["size"], "offset": entry.get("offset")}
+                    for key, entry in (state or {}).get("files", {}).items()},
+        "files": {name: (tmp_path / name).stat().st_size for name in (DATA_FILE, TABLES_FILE)},
+    }
+    with open(tmp_path / MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    for stale in ARTIFACT_DIR.iterdir():
+        if stale != path and not stale.name.endswith(".tmp"):
+            shutil.rmtree(stale, ignore_errors=True)
+    return path
+
+@timed
+def build_artifacts(data_dir=DATA_DIR, jobs=None, force=False):
+    """运行完整的预处理管道并写入产物，返回 (产物目录, 是否重新构建)
+
+    清洗和部分聚合复用 utils.refresh 的增量状态（同时更新持久化状态，
+    应用启动时不会再读取数据文件），CSV 按行切段后在 jobs 个进程中并行处理。
+    之后的聚合表、KPI立方体、数据画像和排序互不依赖，在线程池中并行计算。
+    """
+    jobs = jobs or os.cpu_count()
+    state, new_rows, rebuilt = refresh_tables(data_dir=data_dir, jobs=jobs)
+    fingerprint = state_fingerprint(state)
+    if not force and read_manifest(fingerprint) is not None:
+        return artifact_path(fingerprint), False
+
+    # 增量刷新时 new_rows 只有新增部分，需要按状态读取全部已处理的数据
+    df = new_rows if rebuilt else load_rows(state, jobs=jobs)
+    if df is None:
+        raise ValueError(f"{data_dir} 中没有可用的数据文件")
+
+    partials = state["partials"]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        tables = pool.submit(finalize_tables, partials)
+        cube = pool.submit(build_kpi_cube, partials)
+        profile = pool.submit(profile_data, df, fingerprint)
+        df = pool.submit(sort_by_date, df)
+        tables = tables.result()
+        tables["kpi_cube"] = cube.result()
+        tables["profile"] = profile.result()
+        df = df.result()
+
+    return write_artifacts(df, tables, fingerprint, state), True
@@ -0,0 +1,97 @@
+"""
+相关性计算模块
+"""
+import numpy as np
+import pandas as pd
+from utils.perf import timed
+from utils.view import view_cached
+
+# 按块累加共矩和，峰值内存与块大小而非总行数相关
+COMOMENT_CHUNK_ROWS = 1_000_000
+
+@timed
+@view_cached
+def comoments(df):
+    """一次扫描计算各数值列的共矩和，按缺失模式分组
+
+    对每一种缺失模式（哪些列非空）保存行数 n、各列和 Σx 以及
+    交叉积和 Σxxᵀ。任意列子集的相关矩阵都可以只由这些和得到，
+    无需再访问原始数据。数值先减去各列均值以减小抵消误差。
+    """
+    numeric = df.select_dtypes(include=[np.number])
+    columns = list(numeric.columns)
+    k = len(columns)
+    shift = numeric.mean().to_numpy(dtype=np.float64)
+    bit_values = np.left_shift(1, np.arange(k), dtype=np.int64)
+
+    patterns = {}
+    for start in range(0, len(numeric), COMOMENT_CHUNK_ROWS):
+        block = numeric.iloc[start:start + COMOMENT_CHUNK_ROWS].to_numpy(dtype=np.float64, na_value=np.nan)
+        present = ~np.isnan(block)
+        block = np.where(present, block - shift, 0.0)
+
+        codes = present.astype(np.int64) @ bit_values
+        order = np.argsort(codes, kind='stable')
+        unique_codes, starts = np.unique(codes[order], return_index=True)
+        for code, rows in zip(unique_codes, np.split(order, starts[1:])):
+            values = block[rows]
+            n, total, cross = patterns.get(int(code), (0, np.zeros(k), np.zeros((k, k))))
+            patterns[int(code)] = (n + len(rows), total + values.sum(axis=0), cross + values.T @ values)
+
+    codes = np.array(sorted(patterns), dtype=np.int64)
+    return {
+        'columns': columns,
+        'present': (codes[:, None] & bit_values[None, :]) != 0,
+        'n': np.array([patterns[code][0] for code in codes], dtype=np.float64),
+        'sum': np.array([patterns[code][1] for code in codes]).reshape(len(codes), k),
+        'cross': np.array([patterns[code][2] for code in codes]).reshape(len(codes), k, k),
+    }
+
+@timed
+def correlation_matrix(moments, columns=None, pairwise=False):
+    """由共矩和计算相关矩阵，O(模式数 × k²)
+
+    默认只使用所选列全部非空的行（与 df[columns].dropna().corr() 一致）；
+    pairwise=True 时每对列各自使用两列都非空的行（与 df.corr() 一致）。
+    """
+    all_columns = moments['columns']
+    columns = all_columns if columns is None else list(columns)
+    idx = [all_columns.index(col) for col in columns]
+
+    present = moments['present'][:, idx].astype(np.float64)
+    n_p = moments['n']
+    sums = moments['sum'][:, idx]
+    cross = moments['cross'][:, idx][:, :, idx]
+    squares = np.diagonal(cross, axis1=1, axis2=2)
+
+    if pairwise:
+        weights = present
+    else:
+        complete = present.all(axis=1).astype(np.float64)
+        weights = np.repeat(complete[:, None], len(idx), axis=1)
+
+    # [i, j] 元素为 i、j 两列同时非空的行上的统计量
+    n = (weights * n_p[:, None]).T @ weights
+    sum_x = (weights * sums).T @ weights
+    sum_xx = (weights * squares).T @ weights
+    sum_xy = np.einsum('pi,pj,pij->ij', weights, weights, cross)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * sum_xy - sum_x * sum_x.T
+        var_x = n * sum_xx - sum_x ** 2
+        corr = cov / np.sqrt(var_x * var_x.T)
+    corr[n < 2] = np.nan
+    corr = np.clip(corr, -1.0, 1.0)
+    np.fill_diagonal(corr, np.where(np.diag(n) >= 2, 1.0, np.nan))
+    return pd.DataFrame(corr, index=columns, columns=columns)
+
+def strongest_correlation(corr_matrix):
+    """返回绝对值最大的相关系数对 (列1, 列2, r)；没有有效值时返回 None"""
+    upper = corr_matrix.where(np.triu(np.ones(corr_matrix.shape), k=1).astype(bool))
+    stacked = upper.stack().dropna()
+    if len(stacked) == 0:
+        return None
+
+    max_corr, min_corr = stacked.max(), stacked.min()
+    pair = stacked.idxmax() if abs(max_corr) > abs(min_corr) else stacked.idxmin()
+    return pair[0], pair[1], stacked[pair]
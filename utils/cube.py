@@ -0,0 +1,75 @@
+"""
+KPI立方体模块
+"""
+import numpy as np
+import pandas as pd
+from utils.perf import timed
+
+KPI_COLUMNS = ['temperature', 'humidity', 'pressure', 'wind_speed']
+
+def _sparse_table(values, reducer):
+    """构建稀疏表：第 k 层第 i 项为 values[i : i + 2**k] 的归约结果"""
+    levels = [values]
+    width = 1
+    while width * 2 <= len(values):
+        prev = levels[-1]
+        levels.append(reducer(prev[:-width], prev[width:]))
+        width *= 2
+    return levels
+
+def _range_query(levels, reducer, lo, hi):
+    """在稀疏表上查询闭区间 [lo, hi] 的归约结果，O(1)"""
+    k = int(hi - lo + 1).bit_length() - 1
+    return reducer(levels[k][lo], levels[k][hi - (1 << k) + 1])
+
+@timed
+def build_kpi_cube(partials, columns=KPI_COLUMNS):
+    """由按日部分聚合构建KPI立方体
+
+    每列保存按日的前缀和、前缀计数以及最小/最大值稀疏表，
+    任意日期范围的均值、最小值和最大值只需两次二分查找。
+    """
+    daily = partials.get('timeseries')
+    if not daily:
+        return None
+
+    sums = daily['sum'].sort_index()
+    days = sums.index.values.astype('datetime64[D]')
+    columns = [col for col in columns if col in sums.columns]
+
+    cube = {
+        'days': days,
+        'rows': np.concatenate([[0], np.cumsum(daily['rows'].reindex(sums.index).to_numpy(dtype=np.int64))]),
+        'columns': {},
+    }
+    for col in columns:
+        counts = daily['count'][col].reindex(sums.index).to_numpy(dtype=np.int64)
+        cube['columns'][col] = {
+            'sum': np.concatenate([[0.0], np.cumsum(sums[col].to_numpy(dtype=np.float64))]),
+            'count': np.concatenate([[0], np.cumsum(counts)]),
+            'min': _sparse_table(daily['min'][col].reindex(sums.index).to_numpy(dtype=np.float64), np.fmin),
+            'max': _sparse_table(daily['max'][col].reindex(sums.index).to_numpy(dtype=np.float64), np.fmax),
+        }
+    return cube
+
+def query_kpis(cube, date_range=None):
+    """查询日期范围（含首尾两天）内各列的均值、最小值、最大值和记录数"""
+    days = cube['days']
+    lo, hi = 0, len(days)
+    if date_range:
+        start, end = (np.datetime64(pd.Timestamp(d).date(), 'D') for d in date_range)
+        lo = int(np.searchsorted(days, start, side='left'))
+        hi = int(np.searchsorted(days, end, side='right'))
+
+    result = {'total_records': int(cube['rows'][hi] - cube['rows'][lo])}
+    for col, stats in cube['columns'].items():
+        count = stats['count'][hi] - stats['count'][lo]
+        if count == 0:
+            result[col] = {'mean': np.nan, 'min': np.nan, 'max': np.nan}
+            continue
+        result[col] = {
+            'mean': (stats['sum'][hi] - stats['sum'][lo]) / count,
+            'min': _range_query(stats['min'], np.fmin, lo, hi - 1),
+            'max': _range_query(stats['max'], np.fmax, lo, hi - 1),
+        }
+    return result
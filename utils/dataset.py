@@ -0,0 +1,85 @@
+"""
+数据集句柄模块
+"""
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+import pandas as pd
+from utils.view import set_view_key
+
+@dataclass(frozen=True)
+class DatasetMeta:
+    """数据集元信息（加载时计算一次）"""
+    rows: int
+    columns: Tuple[str, ...]
+    dtypes: Mapping[str, str]
+    date_min: Optional[pd.Timestamp]
+    date_max: Optional[pd.Timestamp]
+    fingerprint: str
+    memory_bytes: int
+    memory_saved: int
+
+@dataclass(frozen=True)
+class Dataset:
+    """不可变的数据集句柄：清洗后的数据、聚合表和元信息"""
+    df: pd.DataFrame
+    tables: Mapping[str, object]
+    meta: DatasetMeta
+
+def describe(df, fingerprint=""):
+    """计算数据集元信息"""
+    date_min = date_max = None
+    if 'date' in df.columns:
+        dates = df['date']
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, errors='coerce')
+        date_min, date_max = dates.min(), dates.max()
+        if pd.isna(date_min):
+            date_min = date_max = None
+
+    memory_bytes = int(df.memory_usage(deep=True).sum())
+    compaction = df.attrs.get('compaction')
+    memory_saved = compaction['before'] - compaction['after'] if compaction else 0
+
+    return DatasetMeta(
+        rows=len(df),
+        columns=tuple(df.columns),
+        dtypes=MappingProxyType({col: str(dtype) for col, dtype in df.dtypes.items()}),
+        date_min=date_min,
+        date_max=date_max,
+        fingerprint=fingerprint,
+        memory_bytes=memory_bytes,
+        memory_saved=memory_saved,
+    )
+
+def extend_meta(meta, df, new_rows, fingerprint=""):
+    """由原有元信息和追加的新行得到 df（原有数据加新行）的元信息，不扫描原有行
+
+    内存占用按 df 的列统计：数值、时间和分类列只读取数组大小。
+    """
+    date_min, date_max = meta.date_min, meta.date_max
+    if 'date' in new_rows.columns and new_rows['date'].notna().any():
+        new_min, new_max = new_rows['date'].min(), new_rows['date'].max()
+        date_min = new_min if date_min is None else min(date_min, new_min)
+        date_max = new_max if date_max is None else max(date_max, new_max)
+
+    compaction = df.attrs.get('compaction')
+    return DatasetMeta(
+        rows=len(df),
+        columns=tuple(df.columns),
+        dtypes=MappingProxyType({col: str(dtype) for col, dtype in df.dtypes.items()}),
+        date_min=date_min,
+        date_max=date_max,
+        fingerprint=fingerprint,
+        memory_bytes=int(df.memory_usage(deep=True).sum()),
+        memory_saved=compaction['before'] - compaction['after'] if compaction else 0,
+    )
+
+def make_dataset(df, tables, fingerprint="", meta=None):
+    """创建数据集句柄；指纹同时记录为视图键，作为派生结果的缓存键
+
+    meta 为 None 时扫描 df 计算元信息（见 describe）。
+    """
+    if fingerprint:
+        set_view_key(df, fingerprint)
+    return Dataset(df=df, tables=MappingProxyType(dict(tables)), meta=meta or describe(df, fingerprint))
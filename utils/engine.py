@@ -0,0 +1,351 @@
+"""
+执行后端模块
+make_tables、calculate_kpis 和 validate_data 的可替换实现：
+pandas 后端读取整个数据框后计算（默认），Arrow 后端直接在 data/ 下的文件上
+以向量化查询执行，只读取需要的列，日期条件在扫描时过滤，扫描和分组聚合使用多个线程。
+后端用于基准测试和离线分析：应用的加载路径（utils.loader / utils.refresh）不经过这里，
+那里的增量状态和共享数据集需要完整的清洗后数据框
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import os
+import re
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+from utils.io import DATA_DIR, discover_files, ingest_cache_path, load_dataset
+from utils.perf import timed
+from utils.prep import (CATEGORY_MAX_RATIO, DATE_FORMATS, calculate_kpis, clean_data, clean_names,
+                        float32_safe, format_tables, make_tables, validate_data)
+from utils.profile import dtype_class
+
+BACKEND_ENV = "CLIMATE_BACKEND"
+DEFAULT_BACKEND = "pandas"
+# KPI 用到的列
+KPI_COLUMNS = ('temperature', 'humidity', 'pressure', 'wind_speed')
+
+def _date_bounds(date_range):
+    """日期范围对应的 [start, end) 时间戳，结束日期包含当天全天"""
+    start, end = date_range
+    return pd.Timestamp(start), pd.Timestamp(end) + pd.Timedelta(days=1)
+
+def _in_range(dates, date_range):
+    """date 落在日期范围内的掩码（与 calculate_kpis 和过滤视图一致）"""
+    start, end = _date_bounds(date_range)
+    return (dates >= start) & (dates < end)
+
+class PandasBackend:
+    """读入整个数据框后由 utils.prep 计算"""
+
+    name = "pandas"
+
+    def load(self, data_dir=DATA_DIR, date_range=None):
+        """读取并清洗数据，按日期范围过滤"""
+        df = clean_data(load_dataset(data_dir, date_range), inplace=True)
+        if df is not None and date_range:
+            df = df[_in_range(df['date'], date_range)]
+        return df
+
+    def make_tables(self, data_dir=DATA_DIR, date_range=None):
+        return make_tables(self.load(data_dir, date_range))
+
+    def calculate_kpis(self, data_dir=DATA_DIR, filters=None):
+        date_range = filters.get('date_range') if filters else None
+        return calculate_kpis(self.load(data_dir, date_range))
+
+    def validate_data(self, data_dir=DATA_DIR, date_range=None):
+        return validate_data(self.load(data_dir, date_range))
+
+def _timestamp_unit():
+    """parse_dates 解析结果的时间单位（pandas 2 为 ns，pandas 3 按精度推断为 us）"""
+    return np.datetime_data(pd.to_datetime(pd.Series(['2000-01-01 00:00:00']), format=DATE_FORMATS[0]).dtype)[0]
+
+def _date_format(dataset, column):
+    """与 parse_dates 相同：按首个非空值确定日期格式，无法识别时返回 None"""
+    values = dataset.head(1000, columns=[column]).column(0).drop_null()
+    if len(values) == 0:
+        return None
+    sample = str(values[0].as_py())
+    for fmt in DATE_FORMATS:
+        try:
+            datetime.strptime(sample, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return None
+
+def _open(path):
+    """打开单个数据文件
+
+    CSV 已有 Arrow 缓存（见 utils.io.read_csv_cached）时直接扫描内存映射的缓存，
+    否则解析 CSV，日期列按字符串读取，再按检测到的格式解析。
+    """
+    if path.suffix == ".parquet":
+        return ds.dataset(path, format="parquet")
+    cache_path = ingest_cache_path(path)
+    if cache_path.exists():
+        return ds.dataset(cache_path, format="ipc")
+    names = ds.dataset(path, format="csv").schema.names
+    date_col = next((col for col, name in clean_names(names).items() if name == 'date'), None)
+    column_types = {date_col: pa.string()} if date_col is not None else {}
+    file_format = ds.CsvFileFormat(convert_options=pa_csv.ConvertOptions(column_types=column_types))
+    return ds.dataset(path, format=file_format)
+
+def _day_pattern(fmt):
+    """提取日期字符串中“日”字段的正则表达式"""
+    pattern = re.escape(fmt)
+    return "^" + re.sub(r"%([a-zA-Z])", lambda m: r"(?P<day>\d+)" if m.group(1) == "d" else r"\d+", pattern)
+
+def _strptime(field, fmt, unit):
+    """按格式解析日期字符串，无法解析的值为空
+
+    Arrow 的 strptime 会把超出当月天数的日期顺延（如 2030-02-29 → 03-01），
+    pandas 则视为无效；这里比较字符串中的“日”与解析结果，不一致时置空。
+    """
+    parsed = pc.strptime(field, format=fmt, unit=unit, error_is_null=True)
+    if "%d" not in fmt:
+        return parsed
+    day = pc.struct_field(pc.extract_regex(field, _day_pattern(fmt)), [0]).cast(pa.int64())
+    return pc.if_else(pc.equal(day, pc.day(parsed)), parsed, pa.scalar(None, pa.timestamp(unit)))
+
+def _date_expression(dataset, column, unit):
+    """date 列的投影表达式：字符串列按格式解析，时间戳列统一单位"""
+    field = ds.field(column)
+    dtype = dataset.schema.field(column).type
+    if pa.types.is_timestamp(dtype):
+        return field.cast(pa.timestamp(unit))
+    if pa.types.is_string(dtype) or pa.types.is_large_string(dtype):
+        fmt = _date_format(dataset, column)
+        if fmt is not None:
+            return _strptime(field, fmt, unit)
+    return field.cast(pa.timestamp(unit))
+
+def _date_condition(date, date_range, unit):
+    """日期非空且落在日期范围内的过滤条件"""
+    condition = date.is_valid()
+    if date_range:
+        start, end = (pa.scalar(bound, pa.timestamp(unit)) for bound in _date_bounds(date_range))
+        condition &= (date >= start) & (date < end)
+    return condition
+
+def _scan_file(path, columns=None, date_range=None, valid_dates=False):
+    """扫描单个文件：投影到清洗后的列名，并按日期过滤
+
+    时间戳类型的日期列（Parquet）在扫描时过滤，可按行组统计信息跳过数据；
+    需要解析的字符串日期列先在投影中解析一次，再过滤投影后的表，
+    避免过滤和投影各解析一遍。
+    """
+    dataset = _open(path)
+    names = clean_names(dataset.schema.names)
+    unit = _timestamp_unit()
+    date_col = next((raw for raw, name in names.items() if name == 'date'), None)
+    filtered = date_col is not None and bool(date_range or valid_dates)
+
+    projection = {}
+    for raw, name in names.items():
+        if name == 'date':
+            projection[name] = _date_expression(dataset, raw, unit)
+        elif columns is None or name in columns:
+            projection[name] = ds.field(raw)
+    if 'date' in projection and not filtered and columns is not None and 'date' not in columns:
+        del projection['date']
+
+    if not filtered:
+        return dataset.to_table(columns=projection, use_threads=True)
+    if pa.types.is_timestamp(dataset.schema.field(date_col).type):
+        table = dataset.to_table(columns=projection, filter=_date_condition(projection['date'], date_range, unit),
+                                 use_threads=True)
+    else:
+        table = dataset.to_table(columns=projection, use_threads=True)
+        table = table.filter(_date_condition(ds.field('date'), date_range, unit))
+    if columns is not None and 'date' not in columns:
+        table = table.drop_columns(['date'])
+    return table
+
+def _int_type(values):
+    """与 pd.to_numeric(downcast='integer') 相同：能容纳最值的最小有符号整数类型"""
+    bounds = pc.min_max(values)
+    low, high = bounds['min'].as_py(), bounds['max'].as_py()
+    if low is None:
+        return pa.int8()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return pa.from_numpy_dtype(dtype)
+    return values.type
+
+def _compact_column(values):
+    """按 clean_data 的规则压缩单列类型（含空值的整数列与 pandas 一样按浮点处理）"""
+    dtype = values.type
+    if pa.types.is_integer(dtype) and values.null_count:
+        values, dtype = values.cast(pa.float64()), pa.float64()
+    if pa.types.is_floating(dtype) and dtype != pa.float32():
+        if float32_safe(values.to_numpy(zero_copy_only=False).astype(np.float64)):
+            return values.cast(pa.float32())
+    elif pa.types.is_integer(dtype):
+        return values.cast(_int_type(values))
+    elif pa.types.is_string(dtype) or pa.types.is_large_string(dtype):
+        if len(values) > 0 and pc.count_distinct(values).as_py() <= CATEGORY_MAX_RATIO * len(values):
+            return values.dictionary_encode()
+    return values
+
+@timed
+def scan(data_dir=DATA_DIR, columns=None, date_range=None, valid_dates=False):
+    """读取数据目录下的文件并清洗为 Arrow 表
+
+    只读取 columns 中的列（清洗后的列名，None 为全部），日期范围之外的
+    分区被剪枝、行在扫描时过滤；valid_dates=True 时丢弃日期为空的行。
+    各文件在线程池中并行扫描，Arrow 在每个文件内部也使用多个线程。
+    """
+    files = discover_files(data_dir, date_range)
+    if not files:
+        return None
+
+    def read(path):
+        return _scan_file(path, columns, date_range, valid_dates)
+    with ThreadPoolExecutor(max_workers=min(32, len(files))) as pool:
+        parts = list(pool.map(read, files))
+    table = pa.concat_tables(parts, promote_options="permissive") if len(parts) > 1 else parts[0]
+
+    compacted = [_compact_column(table.column(name)) if name != 'date' else table.column(name)
+                 for name in table.column_names]
+    return pa.table(compacted, names=table.column_names)
+
+def _numeric_columns(table):
+    """数值列（与 select_dtypes(include=[np.number]) 一致，不含布尔列）"""
+    return [field.name for field in table.schema
+            if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)]
+
+def _decode(values):
+    """字典编码（分类）列还原为普通列，部分计算内核不支持字典类型"""
+    if pa.types.is_dictionary(values.type):
+        return values.cast(values.type.value_type)
+    return values
+
+def _group_keys(table):
+    """各聚合表的分组键名和键值（与 utils.prep 的分组键一致）
+
+    按月的键为当月第一天，分组后再格式化为年月字符串（逐行格式化很慢）。
+    """
+    dates = table.column('date')
+    keys = {
+        'timeseries': ('date_only', pc.floor_temporal(dates, unit='day')),
+        'monthly': ('year_month', pc.floor_temporal(dates, unit='month')),
+        'yearly': ('year', pc.year(dates).cast(pa.int32())),
+    }
+    if 'weather' in table.column_names:
+        keys['by_weather'] = ('weather', _decode(table.column('weather')))
+    return keys
+
+def _mean(stats, col):
+    """由分组和与计数求均值（和与 utils.prep.partial_tables 一样在 float64 中累加）"""
+    sums = stats.column(f"{col}_sum").cast(pa.float64())
+    return sums.to_pandas().fillna(0) / stats.column(f"{col}_count").to_pandas()
+
+def _pandas_dtype(values):
+    """Arrow 列转换为 pandas 后的类型"""
+    return pa.table({'values': values.slice(0, 0)}).to_pandas()['values'].dtype
+
+class ArrowBackend:
+    """直接在数据文件上以 Arrow 计算内核执行"""
+
+    name = "arrow"
+
+    def make_tables(self, data_dir=DATA_DIR, date_range=None):
+        table = scan(data_dir, date_range=date_range, valid_dates=True)
+        if table is None or 'date' not in table.column_names:
+            return {}
+        numeric_cols = _numeric_columns(table)
+        if table.num_rows == 0 or not numeric_cols:
+            return {}
+
+        tables = {}
+        for name, (key, values) in _group_keys(table).items():
+            grouped = pa.table([values, *(table.column(col) for col in numeric_cols)], names=[key, *numeric_cols])
+            stats = grouped.group_by(key, use_threads=True).aggregate(
+                [(col, stat) for col in numeric_cols for stat in ('sum', 'count')])
+            # pandas 分组时丢弃空键
+            stats = stats.filter(pc.is_valid(stats.column(key))).sort_by(key)
+            key_values = stats.column(key)
+            if name == 'monthly':
+                key_values = pc.strftime(key_values, format='%Y-%m')
+            tables[name] = pd.DataFrame({
+                key: key_values.to_pandas(),
+                **{col: _mean(stats, col) for col in numeric_cols},
+            })
+        return format_tables(tables)
+
+    def calculate_kpis(self, data_dir=DATA_DIR, filters=None):
+        date_range = filters.get('date_range') if filters else None
+        table = scan(data_dir, columns=KPI_COLUMNS, date_range=date_range)
+        if table is None:
+            return {}
+
+        kpis = {}
+        columns = table.column_names
+        if 'temperature' in columns:
+            bounds = pc.min_max(table.column('temperature'))
+            kpis['avg_temperature'] = pc.mean(table.column('temperature')).as_py()
+            kpis['max_temperature'] = bounds['max'].as_py()
+            kpis['min_temperature'] = bounds['min'].as_py()
+        if 'humidity' in columns:
+            kpis['avg_humidity'] = pc.mean(table.column('humidity')).as_py()
+        if 'pressure' in columns:
+            kpis['avg_pressure'] = pc.mean(table.column('pressure')).as_py()
+        if 'wind_speed' in columns:
+            kpis['avg_wind_speed'] = pc.mean(table.column('wind_speed')).as_py()
+            kpis['max_wind_speed'] = pc.max(table.column('wind_speed')).as_py()
+        kpis['total_records'] = table.num_rows
+        return kpis
+
+    def validate_data(self, data_dir=DATA_DIR, date_range=None):
+        table = scan(data_dir, date_range=date_range)
+        if table is None:
+            return {}
+
+        rows = table.num_rows
+        missing, cardinality, dtypes, classes, minimum, maximum = {}, {}, {}, {}, {}, {}
+        for name in table.column_names:
+            values = table.column(name)
+            dtype = _pandas_dtype(values)
+            nulls = values.null_count
+            if pa.types.is_floating(values.type):
+                nulls += int(pc.sum(pc.is_nan(values)).as_py() or 0)
+            missing[name] = nulls
+            # pandas 按哈希计数，空值计为一个取值
+            cardinality[name] = pc.count_distinct(_decode(values), mode='all').as_py()
+            dtypes[name] = str(dtype)
+            classes[name] = dtype_class(pd.Series([], dtype=dtype))
+            minimum[name] = maximum[name] = None
+            if classes[name] in ('numeric', 'datetime') and nulls < rows:
+                bounds = pc.min_max(values)
+                low, high = pa.array([bounds['min'], bounds['max']], values.type).to_pandas()
+                minimum[name], maximum[name] = low, high
+
+        decoded = pa.table([_decode(column) for column in table.columns], names=table.column_names)
+        unique_rows = decoded.group_by(table.column_names, use_threads=True).aggregate([]).num_rows
+        return {
+            "total_rows": rows,
+            "total_columns": table.num_columns,
+            "missing_values": missing,
+            "missing_percentage": {col: (count / rows * 100 if rows else np.nan) for col, count in missing.items()},
+            "duplicates": rows - unique_rows,
+            "numeric_columns": [col for col, cls in classes.items() if cls == 'numeric'],
+            "categorical_columns": [col for col, cls in classes.items() if cls == 'categorical'],
+            "cardinality": cardinality,
+            "dtypes": dtypes,
+            "min": minimum,
+            "max": maximum,
+        }
+
+BACKENDS = {backend.name: backend for backend in (PandasBackend, ArrowBackend)}
+
+def get_backend(name=None):
+    """返回执行后端；未指定时读取环境变量 CLIMATE_BACKEND，默认为 pandas"""
+    name = name or os.environ.get(BACKEND_ENV, DEFAULT_BACKEND)
+    if name not in BACKENDS:
+        raise ValueError(f"未知的执行后端 {name}，可选: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
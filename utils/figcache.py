@@ -0,0 +1,148 @@
+"""
+图表缓存模块
+按数据指纹、函数、参数和界面语言缓存序列化后的 Plotly 图表，按字节数做 LRU 淘汰
+"""
+from collections import OrderedDict
+import functools
+import hashlib
+import json
+import sys
+import threading
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+import streamlit as st
+from utils.perf import count_cache
+from utils.view import view_key
+
+# 所有会话共享的缓存总字节数上限
+MAX_BYTES = 64 * 1024 * 1024
+# 没有视图键的数据框按内容哈希，超过该行数时不缓存（哈希代价接近重新构建）
+MAX_HASH_ROWS = 200_000
+
+class FigureCache:
+    """线程安全的 LRU 缓存，按值的字节数计算容量"""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value, size):
+        """写入一项；单项超过容量时不缓存"""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+@st.cache_resource
+def figure_cache():
+    """进程内所有会话共享的图表缓存"""
+    return FigureCache()
+
+class CachedFigure(go.Figure):
+    """由缓存的 JSON 构成的只读图表
+
+    st.plotly_chart 对 Figure 只调用 to_dict 再编码为 JSON，这里直接返回
+    缓存的内容，跳过逐个属性的构建和校验。layout 只保留宽高，
+    供 Streamlit 计算图表尺寸；对该对象的修改不会反映到输出中。
+    """
+
+    def __init__(self, payload, height=None, width=None):
+        super().__init__(layout={'height': height, 'width': width})
+        self._payload = payload
+
+    def to_dict(self):
+        return json.loads(self._payload)
+
+    def to_plotly_json(self):
+        return self.to_dict()
+
+    def to_json(self, *args, **kwargs):
+        if args or kwargs:
+            return pio.to_json(self.to_dict(), *args, validate=False, **kwargs)
+        return self._payload
+
+def _frame_key(df):
+    """数据框的缓存键：有视图键时直接使用，否则对较小的数据框按内容哈希"""
+    key = view_key(df)
+    if key is not None:
+        return ('view', key, tuple(map(str, df.columns)))
+    if len(df) > MAX_HASH_ROWS:
+        raise TypeError("数据框过大且没有视图键")
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode('utf-8'))
+    return ('data', digest.hexdigest())
+
+def _freeze(value):
+    """把参数转换为可哈希的缓存键，无法转换时抛出 TypeError"""
+    if isinstance(value, pd.DataFrame):
+        return _frame_key(value)
+    if isinstance(value, pd.Series):
+        return _frame_key(value.to_frame())
+    if isinstance(value, np.ndarray):
+        return ('array', str(value.dtype), value.shape, hashlib.sha1(value.tobytes()).hexdigest())
+    if isinstance(value, dict):
+        return ('dict', tuple((k, _freeze(v)) for k, v in sorted(value.items(), key=lambda item: repr(item[0]))))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    hash(value)
+    return value
+
+def figure_cached(func):
+    """装饰器：缓存 func 返回的图表的 JSON，命中时跳过构建
+
+    st.plotly_chart 仍会解析缓存的 JSON 并重新编码（使用 orjson 时每个图表约 1 ms），
+    省下的是逐个属性构建、校验和首次序列化图表的开销。
+
+    缓存键为函数名、各参数（数据框按数据指纹或内容哈希）和当前界面语言。
+    参数无法作为键时直接构建，不缓存。
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            key = (name, _freeze(args), _freeze(kwargs), st.session_state.get('lang'))
+        except TypeError:
+            return func(*args, **kwargs)
+
+        cache = figure_cache()
+        entry = cache.get(key)
+        count_cache('figure', hit=entry is not None)
+        if entry is not None:
+            return CachedFigure(*entry[0])
+
+        fig = func(*args, **kwargs)
+        if fig is None:
+            return None
+        payload = pio.to_json(fig, validate=False)
+        value = (payload, fig.layout.height, fig.layout.width)
+        cache.put(key, value, sys.getsizeof(payload))
+        return CachedFigure(*value)
+    return wrapper
@@ -0,0 +1,14 @@
+"""
+数据集信息模块
+只包含常量，不依赖 pandas 等重型库，介绍页和页面框架可以在数据加载前使用
+"""
+
+DATASET_URL = "https://www.kaggle.com/datasets/saadaliyaseen/climate-and-atmospheric-conditions-data/data"
+DATASET_NAME = "Climate and Atmospheric Conditions Data"
+
+def get_dataset_info():
+    """返回数据集信息"""
+    return {
+        "name": DATASET_NAME,
+        "url": DATASET_URL
+    }
@@ -1,30 +1,235 @@
 """
 数据加载模块
 """
+import hashlib
+import os
+import re
 import pandas as pd
-import streamlit as st
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from utils.perf import count_cache, timed
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from pathlib import Path
 
 DATA_DIR = Path("data")
-DATASET_URL = "https://www.kaggle.com/datasets/saadaliyaseen/climate-and-atmospheric-conditions-data/data"
-DATASET_NAME = "Climate and Atmospheric Conditions Data"
-
-@st.cache_data(show_spinner="正在加载数据...")
-def load_data():
-    """加载气候数据"""
-    csv_files = list(DATA_DIR.glob("*.csv"))
-    
-    if csv_files:
-        df = pd.read_csv(csv_files[0])
-        # 不再在全局显示加载成功的横幅；侧边栏会显示更友好的数据信息
-        return df
+CACHE_DIR = DATA_DIR / ".cache"
+DATA_SUFFIXES = (".csv", ".parquet")
+CHUNK_ROWS = 500_000
+
+# 分区目录：year=2012/month=01（Hive风格）或 2012/01
+_YEAR_RE = re.compile(r"^(?:year=)?(\d{4})$")
+_MONTH_RE = re.compile(r"^(?:month=)?(\d{1,2})$")
+
+def ingest_cache_path(path):
+    """返回CSV对应的Arrow缓存路径（由文件路径、大小和修改时间决定）"""
+    stat = path.stat()
+    path_key = hashlib.sha1(str(path.resolve()).encode("utf-8")).hexdigest()[:12]
+    stat_key = f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+    return CACHE_DIR / f"{path_key}-{stat_key}.arrow"
+
+def _write_cache(df, cache_path):
+    """将数据写入Arrow缓存，并清理同一文件的旧缓存"""
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # 先写临时文件再原子替换，避免并发读取到不完整的缓存
+        tmp_path = cache_path.with_suffix(".tmp")
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, cache_path)
+
+        path_key = cache_path.name.split("-", 1)[0]
+        for stale in CACHE_DIR.glob(f"{path_key}-*.arrow"):
+            if stale != cache_path:
+                stale.unlink(missing_ok=True)
+    except OSError:
+        # 缓存只是加速手段，写入失败（如只读目录）时直接使用CSV结果
+        pass
+
+@timed
+def read_csv_cached(path):
+    """读取CSV文件，优先使用列式缓存
+
+    首次读取后在 data/.cache/ 下写入未压缩的 Arrow (Feather) 副本，
+    之后冷启动时通过内存映射读取该副本，无需重新解析CSV。
+    CSV 的大小或修改时间变化后缓存自动失效。
+    """
+    path = Path(path)
+    cache_path = ingest_cache_path(path)
+
+    if cache_path.exists():
+        try:
+            table = feather.read_table(cache_path, memory_map=True)
+            count_cache('ingest_arrow', hit=True)
+            # 每列单独成块，避免合并数据块时的额外拷贝
+            return table.to_pandas(split_blocks=True)
+        except (OSError, pa.ArrowInvalid):
+            cache_path.unlink(missing_ok=True)
+
+    count_cache('ingest_arrow', hit=False)
+    df = pd.read_csv(path)
+    # 读取期间文件被追加时，结果与缓存路径记录的大小不一致，不写入缓存
+    if ingest_cache_path(path) == cache_path:
+        _write_cache(df, cache_path)
+    return df
+
+@timed
+def read_file(path):
+    """读取单个CSV或Parquet文件"""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path, memory_map=True)
+    return read_csv_cached(path)
+
+def get_partition(path, data_dir=DATA_DIR):
+    """从分区目录名解析 (年, 月)，无法识别的部分为 None"""
+    year = month = None
+    for part in Path(path).relative_to(data_dir).parts[:-1]:
+        if year is None:
+            match = _YEAR_RE.match(part)
+            if match:
+                year = int(match.group(1))
+                continue
+        elif month is None:
+            match = _MONTH_RE.match(part)
+            if match and 1 <= int(match.group(1)) <= 12:
+                month = int(match.group(1))
+    return year, month
+
+def _partition_in_range(partition, date_range):
+    """判断分区是否与日期范围重叠；未分区的文件总是保留"""
+    year, month = partition
+    if year is None or not date_range:
+        return True
+
+    start, end = (pd.Timestamp(d).date() for d in date_range)
+    if month is None:
+        first, last = date(year, 1, 1), date(year, 12, 31)
     else:
-        st.warning("未找到数据文件，请将CSV文件放在data/目录下")
+        first = date(year, month, 1)
+        last = (pd.Timestamp(first) + pd.offsets.MonthEnd(0)).date()
+    return first <= end and last >= start
+
+@timed
+def discover_files(data_dir=DATA_DIR, date_range=None):
+    """查找数据目录（含分区子目录）下的全部CSV/Parquet文件
+
+    以 "." 开头的目录（如 .cache）被跳过；给定 date_range 时，
+    年/月分区不与该范围重叠的文件会被剪枝，不会被打开。
+    """
+    data_dir = Path(data_dir)
+    files = []
+    for path in sorted(data_dir.rglob("*")):
+        if path.suffix not in DATA_SUFFIXES or not path.is_file():
+            continue
+        if any(part.startswith(".") for part in path.relative_to(data_dir).parts):
+            continue
+        if _partition_in_range(get_partition(path, data_dir), date_range):
+            files.append(path)
+    return files
+
+def _unify_schema(frames):
+    """将多个数据框对齐到同一列集合和列类型"""
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    frames = [frame.reindex(columns=columns) for frame in frames]
+
+    # 在空切片上合并以求出每列的公共类型，代价与行数无关
+    dtypes = pd.concat([frame.iloc[:0] for frame in frames]).dtypes
+    return [frame.astype(dtypes.to_dict(), copy=False) for frame in frames]
+
+def read_files(files, max_workers=None):
+    """并行读取多个文件（见 read_file），按原顺序返回数据框列表"""
+    if len(files) <= 1:
+        return [read_file(path) for path in files]
+    # CSV解析和Arrow读取在C层释放GIL，线程池即可并行
+    with ThreadPoolExecutor(max_workers=max_workers or min(32, len(files))) as pool:
+        return list(pool.map(read_file, files))
+
+@timed
+def load_dataset(data_dir=DATA_DIR, date_range=None, max_workers=None):
+    """并行读取数据目录下的全部文件并按统一模式拼接"""
+    files = discover_files(data_dir, date_range)
+    if not files:
         return None
+    frames = read_files(files, max_workers)
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(_unify_schema(frames), ignore_index=True)
+
+def iter_file_chunks(path, chunksize=CHUNK_ROWS):
+    """按块读取单个文件，每块为一个数据框"""
+    path = Path(path)
+    pool = pa.default_memory_pool()
+    if path.suffix == ".parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas(split_blocks=True)
+            # 把上一块转换时用过的内存还给操作系统，避免内存池逐块累积
+            pool.release_unused()
+        return
+
+    cache_path = ingest_cache_path(path)
+    if cache_path.exists():
+        # 内存映射的缓存按切片转换，只有当前块会被物化
+        table = feather.read_table(cache_path, memory_map=True)
+        for offset in range(0, table.num_rows, chunksize):
+            yield table.slice(offset, chunksize).to_pandas(split_blocks=True)
+            pool.release_unused()
+        return
+
+    yield from pd.read_csv(path, chunksize=chunksize)
+
+class _RangeReader:
+    """只暴露文件 [start, stop) 字节范围的只读文件对象"""
+
+    def __init__(self, file, start, stop):
+        self._file = file
+        self._stop = stop
+        self._file.seek(start)
+
+    def read(self, size=-1):
+        remaining = self._stop - self._file.tell()
+        if remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self._file.read(size)
+
+    def __iter__(self):
+        return iter(lambda: self.read(1 << 16), b"")
+
+def csv_header(path):
+    """返回CSV的列名"""
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+def complete_size(path):
+    """返回最后一个完整行之后的字节偏移（忽略正在写入的半行）"""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            step = min(1 << 16, pos)
+            pos -= step
+            f.seek(pos)
+            idx = f.read(step).rfind(b"\n")
+            if idx >= 0:
+                return pos + idx + 1
+    return 0
+
+@timed
+def read_csv_range(path, start, stop, columns=None, chunksize=CHUNK_ROWS):
+    """按块读取CSV中 [start, stop) 字节范围内的行
+
+    start 为 0 时从表头开始读取；否则 start 必须位于行首，
+    并用 columns 作为列名（通常来自 csv_header）。
+    """
+    with open(path, "rb") as f:
+        reader = _RangeReader(f, start, stop)
+        if start == 0:
+            yield from pd.read_csv(reader, chunksize=chunksize)
+        else:
+            yield from pd.read_csv(reader, header=None, names=columns, chunksize=chunksize)
 
-def get_dataset_info():
-    """返回数据集信息"""
-    return {
-        "name": DATASET_NAME,
-        "url": DATASET_URL
-    }
+def iter_chunks(data_dir=DATA_DIR, date_range=None, chunksize=CHUNK_ROWS):
+    """依次按块读取数据目录下的全部文件，用于内存无法容纳整个数据集的场景"""
+    for path in discover_files(data_dir, date_range):
+        yield from iter_file_chunks(path, chunksize)
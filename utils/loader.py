@@ -0,0 +1,180 @@
+"""
+数据加载流程
+增量刷新、预计算产物和共享存储的组合，返回不可变的数据集句柄；
+与页面框架分开，首次导入（pandas、pyarrow 等）推迟到需要数据时
+"""
+import threading
+import streamlit as st
+from utils.append import AppendBuffer
+from utils.artifacts import load_artifacts
+from utils.cube import build_kpi_cube
+from utils.dataset import extend_meta, make_dataset
+from utils.perf import count_cache, timed
+from utils.prep import concat_clean, conform_categories, finalize_tables
+from utils.profile import profile_data, update_profile
+from utils.refresh import load_rows, refresh_tables, state_fingerprint
+from utils.store import append_segment, open_shared, share
+from utils.view import sort_by_date, sorted_after
+
+# 后台加载时依次发布的阶段：KPI立方体、各聚合表、完整数据集
+LOAD_STAGES = ("kpi_cube", "timeseries", "by_weather", "monthly", "yearly", "dataset")
+
+class LoadProgress:
+    """后台加载的进度：已发布的阶段结果，以及等待新阶段的条件变量"""
+
+    def __init__(self):
+        self.results = {}
+        self.error = None
+        self.done = False
+        self.version = 0
+        self._changed = threading.Condition()
+
+    def publish(self, stage, value):
+        with self._changed:
+            self.results[stage] = value
+            self.version += 1
+            self._changed.notify_all()
+
+    def finish(self, error=None):
+        with self._changed:
+            self.error = error
+            self.done = True
+            self.version += 1
+            self._changed.notify_all()
+
+    def tables(self):
+        """已就绪的聚合表（与数据集的 tables 同名）"""
+        return {stage: value for stage, value in self.results.items() if stage != "dataset"}
+
+    def fraction(self):
+        return 1.0 if self.done else len(self.results) / len(LOAD_STAGES)
+
+    def wait(self, version, timeout):
+        """等待到有新阶段发布（版本号不同于 version）或超时"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.version != version, timeout)
+
+@st.cache_resource
+def _processing_state():
+    """跨会话共享的增量处理状态"""
+    return {"lock": threading.Lock(), "progress_lock": threading.Lock()}
+
+def _append(cache, previous, new_rows, tables, fingerprint):
+    """把按日期接在已有数据之后的新行追加到数据集，返回新的数据集；无法追加时返回 None
+
+    新行写入进程内的追加缓冲（已有行不复制），并作为一个段写入共享存储；
+    元信息由原有元信息和新行得到。追加段累计较多时把数据合并写为一个文件，
+    之后改用内存映射的版本，各进程重新共享同一份数据。
+    """
+    if not sorted_after(previous.df, new_rows):
+        return None
+    buffer = cache.get("append_buffer")
+    if buffer is None or buffer.frame is not previous.df:
+        buffer = cache["append_buffer"] = AppendBuffer(previous.df, extra=len(new_rows))
+    df_clean = buffer.append(new_rows)
+    if df_clean is None:
+        cache.pop("append_buffer", None)
+        return None
+
+    meta = extend_meta(previous.meta, df_clean, new_rows, fingerprint)
+    if not append_segment(new_rows, fingerprint, previous.meta.fingerprint, previous.meta.rows):
+        cache.pop("append_buffer", None)
+        df_clean = share(df_clean, fingerprint)
+    return make_dataset(df_clean, tables, fingerprint, meta=meta)
+
+def _load(cache, publish):
+    """加载和预处理数据，每完成一个阶段调用 publish(阶段, 结果)；调用方持有 cache["lock"]"""
+    state, new_rows, rebuilt = refresh_tables(cache.get("tables_state"))
+    cache["tables_state"] = state
+    unchanged = "dataset" in cache and not rebuilt and new_rows is None
+    count_cache('dataset', hit=unchanged)
+    if unchanged:
+        return cache["dataset"]
+
+    fingerprint = state_fingerprint(state)
+    if rebuilt or "dataset" not in cache:
+        # 优先使用离线预计算的产物（见 precompute.py），只需内存映射，不做任何计算
+        artifacts = load_artifacts(fingerprint)
+        if artifacts is not None:
+            cache["dataset"] = make_dataset(*artifacts, fingerprint)
+            return cache["dataset"]
+
+    # 聚合表和KPI立方体只依赖部分聚合，先于读取全部数据发布
+    tables = {"kpi_cube": build_kpi_cube(state["partials"])}
+    publish("kpi_cube", tables["kpi_cube"])
+    for name, table in finalize_tables(state["partials"]).items():
+        tables[name] = table
+        publish(name, table)
+
+    profile = None
+    if rebuilt:
+        df_clean = new_rows
+    elif "dataset" not in cache:
+        # 冷启动：聚合表来自持久化状态；优先映射其他进程已发布的共享数据，
+        # 否则按已处理范围读取清洗后的数据
+        df_clean = open_shared(fingerprint)
+        if df_clean is None:
+            df_clean = load_rows(state)
+    else:
+        # 追加：新行的分类列按已有数据统一类型，数据画像只合并新增行
+        previous = cache["dataset"]
+        new_rows = sort_by_date(conform_categories(new_rows, previous.df))
+        tables["profile"] = update_profile(previous.tables["profile"], new_rows, fingerprint)
+        dataset = _append(cache, previous, new_rows, tables, fingerprint)
+        if dataset is not None:
+            cache["dataset"] = dataset
+            return dataset
+        # 新行早于已有数据或列不一致：拼接后重新排序并整体发布
+        df_clean = concat_clean([previous.df, new_rows])
+        profile = tables["profile"]
+
+    if df_clean is None:
+        cache.pop("dataset", None)
+        return None
+
+    tables["profile"] = profile if profile is not None else profile_data(df_clean, fingerprint)
+    # 按日期排序，过滤视图据此用二分查找切片
+    df_clean = sort_by_date(df_clean)
+    # 发布到共享存储，之后只保留内存映射的只读版本，所有会话和进程共用
+    cache.pop("append_buffer", None)
+    df_clean = share(df_clean, fingerprint)
+    cache["dataset"] = make_dataset(df_clean, tables, fingerprint)
+    return cache["dataset"]
+
+@timed
+def get_processed_data():
+    """加载和预处理数据，返回不可变的数据集句柄；数据文件追加新行后只清洗和聚合新增部分"""
+    cache = _processing_state()
+    with cache["lock"]:
+        with st.spinner("正在加载和预处理数据..."):
+            return _load(cache, lambda stage, value: None)
+
+def _load_in_thread(cache, progress):
+    with cache["lock"]:
+        try:
+            dataset = _load(cache, progress.publish)
+        except Exception as exc:
+            progress.finish(exc)
+            return
+        if dataset is not None:
+            for name, table in dataset.tables.items():
+                if name not in progress.results and name in LOAD_STAGES:
+                    progress.publish(name, table)
+            progress.publish("dataset", dataset)
+        progress.finish()
+
+def start_loading(retry=False):
+    """在后台线程中开始首次加载（已开始或已完成时不重复启动），返回 LoadProgress
+
+    加载完成前页面可按已发布的阶段逐步渲染；完成后（progress.done）由
+    get_processed_data 取得数据集并检查数据文件的追加，此时无需等待。
+    加载失败后保留错误，retry=True 时重新开始。
+    """
+    cache = _processing_state()
+    with cache["progress_lock"]:
+        progress = cache.get("progress")
+        if progress is None or (retry and progress.error is not None):
+            progress = cache["progress"] = LoadProgress()
+            thread = threading.Thread(target=_load_in_thread, args=(cache, progress), name="dataset-loader", daemon=True)
+            thread.start()
+        return progress
@@ -0,0 +1,166 @@
+"""
+并行聚合模块
+把数据框的数值列和分组键放入共享内存，按行分片在进程池中计算各组的部分和与计数，
+合并后得到与 make_tables 相同格式的均值表；工作进程直接读取共享内存，不序列化数据框
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from utils.perf import timed
+from utils.prep import finalize_tables, partial_tables
+
+# 每个分片的最少行数：更小的数据由一个进程计算更快（进程启动和结果合并有固定开销）
+MIN_SHARD_ROWS = 250_000
+# 共享内存中各数组的起始偏移按该字节数对齐
+_ALIGN = 64
+
+def _attach(name):
+    """工作进程：按名称打开共享内存，由创建它的主进程负责释放
+
+    Python 3.13 之前没有 track 参数；进程池的工作进程与主进程共用资源跟踪器，
+    重复登记没有影响，主进程 unlink 时一并取消登记。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _views(shm, layout):
+    """按布局 {名称: (类型, 偏移, 长度)} 返回共享内存上的数组视图"""
+    return {name: np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            for name, (dtype, offset, length) in layout.items()}
+
+def _shard_sums(name, layout, keys, columns, start, stop):
+    """工作进程：计算 [start, stop) 行中各分组的和、计数和行数
+
+    keys 为 {表名: (编码数组名, 分组数)}，编码为 0..分组数-1，-1 表示不参与分组。
+    返回 {表名: (和[分组, 列], 计数[分组, 列], 行数[分组])}。
+    """
+    shm = _attach(name)
+    try:
+        arrays = _views(shm, layout)
+        values = [arrays[col][start:stop] for col in columns]
+        valid = [~np.isnan(v) if v.dtype.kind == 'f' else None for v in values]
+        result = {}
+        for table, (code_name, groups) in keys.items():
+            codes = arrays[code_name][start:stop]
+            keep = codes >= 0
+            sums = np.empty((groups, len(columns)))
+            counts = np.empty((groups, len(columns)), dtype=np.int64)
+            for i, (v, ok) in enumerate(zip(values, valid)):
+                ok = keep if ok is None else keep & ok
+                sums[:, i] = np.bincount(codes[ok], weights=v[ok], minlength=groups)
+                counts[:, i] = np.bincount(codes[ok], minlength=groups)
+            result[table] = (sums, counts, np.bincount(codes[keep], minlength=groups))
+        del arrays, values, codes
+        return result
+    finally:
+        shm.close()
+
+def _group_codes(df):
+    """计算各聚合表的分组编码，返回 {表名: (编码, 分组数, 由编码得到分组键的函数)}
+
+    日期按天、月、年编码为相对最小值的序号，天气按类别编码；
+    分组键与 utils.prep 的分组键（date_only / year_month / year / weather）一致。
+    """
+    dates = df['date'].to_numpy()
+    unit = np.datetime_data(dates.dtype)[0]
+    codes = {}
+    for table, period in (('timeseries', 'D'), ('monthly', 'M'), ('yearly', 'Y')):
+        ordinals = dates.astype(f'M8[{period}]').view(np.int64)
+        first = int(ordinals.min())
+        codes[table] = (ordinals - first, int(ordinals.max()) - first + 1, first, period)
+
+    def key_func(first, period):
+        def keys(index):
+            stamps = (index + first).astype(f'M8[{period}]')
+            if period == 'D':
+                return pd.DatetimeIndex(stamps.astype(f'M8[{unit}]'), name='date_only')
+            if period == 'M':
+                return pd.DatetimeIndex(stamps.astype(f'M8[{unit}]')).to_period('M').rename('year_month')
+            return pd.Index(stamps.astype(np.int64) + 1970, name='year').astype(pd.DatetimeIndex(dates[:0]).year.dtype)
+        return keys
+
+    result = {table: (code, groups, key_func(first, period)) for table, (code, groups, first, period) in codes.items()}
+    if 'weather' in df.columns:
+        weather = df['weather']
+        if isinstance(weather.dtype, pd.CategoricalDtype):
+            code, categories = weather.cat.codes.to_numpy(), weather.cat.categories
+        else:
+            code, categories = pd.factorize(weather)
+        categories = pd.Index(categories, name='weather')
+        result['by_weather'] = (code, len(categories), lambda index: categories[index])
+    return result
+
+def _allocate(arrays):
+    """把各数组复制到一块新的共享内存，返回 (共享内存, 布局)"""
+    layout, offset = {}, 0
+    for name, values in arrays.items():
+        offset = -(-offset // _ALIGN) * _ALIGN
+        layout[name] = (values.dtype.str, offset, len(values))
+        offset += values.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, view in _views(shm, layout).items():
+        view[:] = arrays[name]
+    return shm, layout
+
+def _shards(rows, jobs, min_rows=MIN_SHARD_ROWS):
+    """把 rows 行切成最多 jobs 个大致相等的分片，每片至少 min_rows 行"""
+    parts = max(1, min(jobs, rows // min_rows))
+    bounds = np.linspace(0, rows, parts + 1).astype(int)
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+@timed
+def parallel_partials(df, jobs, min_rows=MIN_SHARD_ROWS):
+    """在 jobs 个进程中按行分片计算部分聚合，返回与 partial_tables 相同结构的 sum 和 count
+
+    数值列和分组编码复制到共享内存一次，工作进程按名称映射同一块内存，
+    只有各分组的和与计数（与分组数成正比）在进程间传递。
+    各分片的和与串行路径一样在 float64 中累加。数据不足两个分片时直接调用 partial_tables。
+    """
+    if df is None or 'date' not in df.columns:
+        return {}
+
+    df = df[df['date'].notna()]
+    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    if len(df) == 0 or not numeric_cols:
+        return {}
+
+    tasks = _shards(len(df), jobs, min_rows)
+    if len(tasks) == 1:
+        return partial_tables(df)
+
+    groups = _group_codes(df)
+    arrays = {f"col{i}": df[col].to_numpy() for i, col in enumerate(numeric_cols)}
+    for table, (code, _, _) in groups.items():
+        arrays[f"key_{table}"] = code
+    shm, layout = _allocate(arrays)
+    del arrays
+
+    keys = {table: (f"key_{table}", count) for table, (_, count, _) in groups.items()}
+    columns = [f"col{i}" for i in range(len(numeric_cols))]
+    try:
+        with ProcessPoolExecutor(len(tasks)) as pool:
+            results = list(pool.map(_shard_sums, *zip(*[(shm.name, layout, keys, columns, start, stop)
+                                                          for start, stop in tasks])))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    partials = {}
+    for table, (_, _, make_keys) in groups.items():
+        # 按分片顺序依次相加，结果与进程调度无关
+        sums, counts, rows = (sum(parts) for parts in zip(*(result[table] for result in results)))
+        observed = np.flatnonzero(rows)
+        index = make_keys(observed)
+        partials[table] = {
+            'sum': pd.DataFrame(sums[observed], index=index, columns=numeric_cols),
+            'count': pd.DataFrame(counts[observed], index=index, columns=numeric_cols),
+        }
+    return partials
+
+@timed
+def make_tables_parallel(df, jobs, min_rows=MIN_SHARD_ROWS):
+    """并行创建聚合表，结果格式与 make_tables 相同"""
+    return finalize_tables(parallel_partials(df, jobs, min_rows))
@@ -0,0 +1,202 @@
+"""
+性能监测模块
+记录各函数的耗时和内存峰值、缓存命中情况，可导出为结构化日志或 Prometheus 文本格式
+"""
+from collections import deque
+from contextlib import contextmanager
+import functools
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# 设置后每个跨度结束时以 JSON Lines 追加写入该文件
+LOG_PATH_ENV = "CLIMATE_PERF_LOG"
+# 设为 1 时启动即开启 tracemalloc 内存统计
+MEMORY_ENV = "CLIMATE_PERF_MEMORY"
+# 内存中保留的最近事件数
+MAX_EVENTS = 1000
+METRIC_PREFIX = "climate"
+
+_lock = threading.Lock()
+_local = threading.local()
+_spans = {}
+_caches = {}
+_events = deque(maxlen=MAX_EVENTS)
+
+def memory_tracing():
+    """是否正在统计内存（tracemalloc 会拖慢 Python 层代码，默认关闭）"""
+    return tracemalloc.is_tracing()
+
+def set_memory_tracing(enabled):
+    """开启或关闭内存统计"""
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def _record(name, seconds, memory, error):
+    """汇总一次跨度并写入事件日志"""
+    event = {
+        'ts': round(time.time(), 3),
+        'span': name,
+        'seconds': round(seconds, 6),
+        'memory_bytes': memory,
+        'thread': threading.current_thread().name,
+    }
+    if error:
+        event['error'] = error
+
+    with _lock:
+        stats = _spans.get(name)
+        if stats is None:
+            stats = _spans[name] = {'calls': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                    'last_seconds': 0.0, 'memory_peak_bytes': None}
+        stats['calls'] += 1
+        stats['errors'] += bool(error)
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats['last_seconds'] = seconds
+        if memory is not None:
+            stats['memory_peak_bytes'] = max(stats['memory_peak_bytes'] or 0, memory)
+        _events.append(event)
+
+    log_path = os.environ.get(LOG_PATH_ENV)
+    if log_path:
+        try:
+            with open(log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+        except OSError:
+            pass
+
+@contextmanager
+def span(name):
+    """测量一段代码的耗时；开启内存统计时同时记录其间的内存峰值增量
+
+    跨度可以嵌套。tracemalloc 的峰值是全局的，内层跨度重置峰值前
+    会把外层已观察到的峰值保存下来，因此外层的峰值包含内层的分配。
+    多个会话并发时内存峰值只是近似值。
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+
+    frame = None
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        if stack and stack[-1] is not None:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        frame = {'start': current, 'peak': current}
+    stack.append(frame)
+
+    error = None
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        memory = None
+        if frame is not None and tracemalloc.is_tracing():
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            memory = frame['peak'] - frame['start']
+            if stack and stack[-1] is not None:
+                stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+        _record(name, seconds, memory, error)
+
+def timed(func=None, *, name=None):
+    """装饰器：把每次调用记录为一个跨度，名称默认为 模块.函数名"""
+    def decorate(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorate(func) if func is not None else decorate
+
+def lazy_import(module):
+    """按需导入模块；首次导入时记录为 import.<模块名> 跨度，用于跟踪新进程的冷启动耗时"""
+    if module in sys.modules:
+        return sys.modules[module]
+    with span(f"import.{module}"):
+        return importlib.import_module(module)
+
+def count_cache(cache, hit):
+    """记录一次缓存查询的结果"""
+    with _lock:
+        stats = _caches.setdefault(cache, {'hits': 0, 'misses': 0})
+        stats['hits' if hit else 'misses'] += 1
+
+def snapshot():
+    """返回当前的汇总统计 {'spans': ..., 'caches': ...}"""
+    with _lock:
+        return {
+            'spans': {name: dict(stats) for name, stats in _spans.items()},
+            'caches': {name: dict(stats) for name, stats in _caches.items()},
+        }
+
+def reset():
+    """清空全部统计和事件"""
+    with _lock:
+        _spans.clear()
+        _caches.clear()
+        _events.clear()
+
+def export_json_lines():
+    """导出最近的事件和当前汇总，格式为 JSON Lines"""
+    with _lock:
+        events = list(_events)
+    lines = [json.dumps(event, ensure_ascii=False) for event in events]
+    lines.append(json.dumps({'ts': round(time.time(), 3), 'summary': snapshot()}, ensure_ascii=False))
+    return '\n'.join(lines) + '\n'
+
+def _label(value):
+    """转义 Prometheus 标签值"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def export_prometheus():
+    """导出 Prometheus 文本格式的指标"""
+    stats = snapshot()
+    metrics = [
+        ('span_calls_total', 'counter', '跨度调用次数', 'calls'),
+        ('span_errors_total', 'counter', '抛出异常的调用次数', 'errors'),
+        ('span_seconds_total', 'counter', '累计耗时（秒）', 'seconds'),
+        ('span_seconds_max', 'gauge', '单次最大耗时（秒）', 'max_seconds'),
+        ('span_seconds_last', 'gauge', '最近一次耗时（秒）', 'last_seconds'),
+        ('span_memory_peak_bytes', 'gauge', '单次调用的最大内存峰值增量（字节）', 'memory_peak_bytes'),
+    ]
+    lines = []
+    for metric, kind, help_text, field in metrics:
+        lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{metric} {kind}")
+        for name, span_stats in sorted(stats['spans'].items()):
+            if span_stats[field] is not None:
+                lines.append(f'{METRIC_PREFIX}_{metric}{{span="{_label(name)}"}} {span_stats[field]}')
+
+    lines.append(f"# HELP {METRIC_PREFIX}_cache_requests_total 缓存查询次数")
+    lines.append(f"# TYPE {METRIC_PREFIX}_cache_requests_total counter")
+    for name, cache_stats in sorted(stats['caches'].items()):
+        for result, field in (('hit', 'hits'), ('miss', 'misses')):
+            lines.append(f'{METRIC_PREFIX}_cache_requests_total{{cache="{_label(name)}",result="{result}"}} '
+                         f'{cache_stats[field]}')
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus(path):
+    """把 Prometheus 指标原子写入文件（供 node_exporter 文本采集器等读取）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(export_prometheus())
+    os.replace(tmp_path, path)
+
+if os.environ.get(MEMORY_ENV) == "1":
+    set_memory_tracing(True)
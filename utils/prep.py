@@ -1,120 +1,396 @@
 """
 数据预处理模块
 """
+from datetime import datetime
 import pandas as pd
 import numpy as np
+from utils.cube import query_kpis
+from utils.perf import timed
+from utils.view import view_cached
+from utils.profile import quality_report, quality_view
 
-def clean_data(df):
-    """清洗数据"""
+# 原始数据中常见的日期格式，按顺序尝试
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S')
+# float32 可精确还原的最大小数位数
+FLOAT32_MAX_DECIMALS = 6
+# 唯一值占比不超过该比例的字符串列转换为分类类型
+CATEGORY_MAX_RATIO = 0.5
+
+@timed
+def parse_dates(values):
+    """解析日期列：按首个非空值确定显式格式，无法识别时退回自动推断"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    first = values.first_valid_index()
+    if first is not None:
+        sample = str(values.loc[first])
+        for fmt in DATE_FORMATS:
+            try:
+                datetime.strptime(sample, fmt)
+            except ValueError:
+                continue
+            return pd.to_datetime(values, format=fmt, errors='coerce')
+    return pd.to_datetime(values, errors='coerce')
+
+def float32_safe(values):
+    """判断浮点列转为 float32 后能否按原有小数位数还原
+
+    要求数值最多有 FLOAT32_MAX_DECIMALS 位小数，且放大为整数后
+    小于 2**23，此时 float32 的舍入误差小于最后一位小数的一半。
+    """
+    finite = values[np.isfinite(values)]
+    if len(finite) == 0:
+        return True
+
+    for decimals in range(FLOAT32_MAX_DECIMALS + 1):
+        if np.array_equal(np.round(finite, decimals), finite):
+            return np.abs(finite).max() * 10 ** decimals < 2 ** 23
+    return False
+
+def _compact_series(series):
+    """压缩单列的类型，无法压缩时原样返回"""
+    if pd.api.types.is_float_dtype(series) and series.dtype != np.float32:
+        if float32_safe(series.to_numpy(dtype=np.float64)):
+            return series.astype(np.float32)
+    elif pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return pd.to_numeric(series, downcast='integer')
+    elif isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+        if len(series) > 0 and series.nunique() <= CATEGORY_MAX_RATIO * len(series):
+            return series.astype('category')
+    return series
+
+@timed
+def compact_dtypes(df):
+    """压缩列类型，返回新数据框和内存报告 {'before', 'after'}（字节）
+
+    精度允许时 float64 降为 float32，整数降为最小的整数类型，
+    低基数的字符串列（如 weather）转为分类类型。
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    compacted = {}
+    for col in df.columns:
+        original = df[col]
+        series = _compact_series(original)
+        if series is not original:
+            compacted[col] = series
+
+    if compacted:
+        df = df.assign(**compacted)
+    return df, {'before': before, 'after': int(df.memory_usage(deep=True).sum())}
+
+# 原始列名（标准化之后）到分析用列名的映射
+COLUMN_MAPPING = {
+    'Temp_C': 'temperature',
+    'Dew_Point_Temp_C': 'dew_point',
+    'Rel_Hum_%': 'humidity',
+    'Wind_Speed_km_h': 'wind_speed',
+    'Visibility_km': 'visibility',
+    'Press_kPa': 'pressure',
+    'Weather': 'weather'
+}
+
+def _standard_name(col):
+    """标准化列名：去除首尾空白，空格和斜杠替换为下划线"""
+    return str(col).strip().replace(' ', '_').replace('/', '_')
+
+def clean_names(columns):
+    """返回 {原始列名: 清洗后的列名}，按 clean_data 输出的列顺序排列"""
+    date_col = 'Date/Time' if 'Date/Time' in columns else ('date' if 'date' in columns else None)
+    names = {col: 'date' if col == date_col else _standard_name(col) for col in columns}
+
+    # 列顺序：未映射的列（Date/Time 解析出的 date 排在其后），然后按映射顺序排列重命名的列
+    mapping_order = list(COLUMN_MAPPING)
+    def position(col):
+        if names[col] in COLUMN_MAPPING:
+            return (2, mapping_order.index(names[col]))
+        return (1 if col == 'Date/Time' else 0, 0)
+
+    return {col: COLUMN_MAPPING.get(names[col], names[col]) for col in sorted(names, key=position)}
+
+@timed
+def clean_data(df, inplace=False):
+    """清洗数据：解析日期、统一列名并压缩列类型
+
+    逐列转换，不复制整个数据框。inplace=True 时每转换一列就从传入的
+    数据框中移除对应的原始列，原始数据随转换逐步释放，峰值内存接近
+    一份数据；调用方之后不应再使用传入的数据框。默认不修改传入的数据框。
+    """
     if df is None:
         return None
-    
-    df = df.copy()
-    
-    # 处理日期列
-    if 'Date/Time' in df.columns:
-        df['date'] = pd.to_datetime(df['Date/Time'], errors='coerce')
-    elif 'date' in df.columns:
-        df['date'] = pd.to_datetime(df['date'], errors='coerce')
-    
-    # 标准化列名
-    df.columns = df.columns.str.strip().str.replace(' ', '_').str.replace('/', '_')
-    
-    # 重命名列以便使用（创建新列后删除原始列，避免重复）
-    column_mapping = {
-        'Temp_C': 'temperature',
-        'Dew_Point_Temp_C': 'dew_point',
-        'Rel_Hum_%': 'humidity',
-        'Wind_Speed_km_h': 'wind_speed',
-        'Visibility_km': 'visibility',
-        'Press_kPa': 'pressure',
-        'Weather': 'weather'
-    }
-    
-    # 先创建新列
-    for old_col, new_col in column_mapping.items():
-        if old_col in df.columns:
-            df[new_col] = df[old_col]
-    
-    # 然后删除原始列（保留新列名如temperature）
-    columns_to_drop = [old_col for old_col in column_mapping.keys() if old_col in df.columns]
-    if columns_to_drop:
-        df = df.drop(columns=columns_to_drop, errors='ignore')
-    
+
+    source = df if inplace else df.copy(deep=False)
+
+    # 日期列解析一次，原始的日期字符串列不保留
+    date_col = 'Date/Time' if 'Date/Time' in source.columns else ('date' if 'date' in source.columns else None)
+    names = clean_names(list(source.columns))
+
+    index_bytes = int(source.index.memory_usage(deep=True))
+    before = after = index_bytes
+    columns = {}
+    for col in list(source.columns):
+        series = source.pop(col)
+        if col == date_col:
+            series = parse_dates(series)
+        series.name = names[col]
+        before += int(series.memory_usage(index=False, deep=True))
+        series = _compact_series(series)
+        after += int(series.memory_usage(index=False, deep=True))
+        columns[series.name] = series
+        del series
+
+    df = pd.DataFrame(columns, index=source.index, columns=list(names.values()))
+    df.attrs['compaction'] = {'before': before, 'after': after}
     return df
 
-def validate_data(df):
-    """验证数据质量"""
+def _is_text(series):
+    return pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+
+def align_categories(frames):
+    """统一各数据块中分类列的类别，返回浅拷贝的数据块列表
+
+    是否转为分类由每块的唯一值占比决定，少量追加的新行可能仍是字符串；
+    某列在任一块中为分类时，其余块的字符串（或全空）列也转为同一分类类型，
+    否则拼接会让整列退化为字符串。类别已一致的块不做转换。
+    """
+    frames = [frame.copy(deep=False) for frame in frames]
+    for col in frames[0].columns:
+        if not all(col in frame.columns for frame in frames):
+            continue
+        pieces = [frame[col] for frame in frames]
+        categorical = [isinstance(piece.dtype, pd.CategoricalDtype) for piece in pieces]
+        if not any(categorical) or not all(
+                is_cat or _is_text(piece) or piece.isna().all() for is_cat, piece in zip(categorical, pieces)):
+            continue
+
+        categories = pd.api.types.union_categoricals(
+            [piece for piece, is_cat in zip(pieces, categorical) if is_cat]).categories
+        for piece, is_cat in zip(pieces, categorical):
+            if not is_cat:
+                extra = pd.Index(piece.dropna().unique()).difference(categories, sort=False)
+                if len(extra):
+                    categories = categories.append(extra.astype(categories.dtype))
+        dtype = pd.CategoricalDtype(categories)
+        for frame in frames:
+            if frame[col].dtype != dtype:
+                frame[col] = frame[col].astype(dtype)
+    return frames
+
+def conform_categories(df, reference):
+    """按已有数据统一新数据块的分类列，只转换新数据块，代价与其行数成正比
+
+    reference 中为分类的列，新块中的对应列转为扩展后的分类类型（已有类别在前，
+    新类别追加在后）；reference 中为字符串的列，新块中的分类列还原为字符串。
+    字符串类别的分类列也满足 is_string_dtype，需先排除，否则新类别会变成缺失值。
+    """
+    df = align_categories([reference.iloc[:0], df])[1]
+    for col in df.columns:
+        if (col in reference.columns and isinstance(df[col].dtype, pd.CategoricalDtype)
+                and not isinstance(reference[col].dtype, pd.CategoricalDtype) and _is_text(reference[col])):
+            df[col] = df[col].astype(reference[col].dtype)
+    return df
+
+@timed
+def concat_clean(frames):
+    """拼接清洗后的数据块：统一分类列的类别，并合并内存压缩报告"""
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return None
+    if len(frames) == 1:
+        return frames[0]
+
+    # 类别不同的分类列直接拼接会退化为字符串，先统一类别（浅拷贝，只替换类别编码）
+    frames = align_categories(frames)
+    result = pd.concat(frames, ignore_index=True)
+    reports = [frame.attrs.get('compaction') for frame in frames]
+    if all(reports):
+        result.attrs['compaction'] = {
+            'before': sum(report['before'] for report in reports),
+            'after': sum(report['after'] for report in reports),
+        }
+    return result
+
+@timed
+@view_cached
+def describe_column(df, col):
+    """返回单列的统计摘要（count/mean/std/min/分位数/max），按视图缓存"""
+    return df[col].describe().to_dict()
+
+@timed
+def validate_data(df, profile=None):
+    """验证数据质量
+
+    报告由数据画像生成（见 utils.profile）：传入与 df 行数一致的预计算画像时
+    不再扫描数据，否则按视图计算一次并缓存报告。
+    """
     if df is None:
         return {}
-    
-    return {
-        "total_rows": len(df),
-        "total_columns": len(df.columns),
-        "missing_values": df.isnull().sum().to_dict(),
-        "missing_percentage": (df.isnull().sum() / len(df) * 100).to_dict(),
-        "duplicates": df.duplicated().sum(),
-        "numeric_columns": list(df.select_dtypes(include=[np.number]).columns),
-        "categorical_columns": list(df.select_dtypes(include=['object']).columns)
+
+    if profile is None or profile['rows'] != len(df):
+        return quality_view(df)
+    return quality_report(profile)
+
+def _group_keys(df):
+    """返回各聚合表的分组键（不复制数据框）"""
+    keys = {
+        'timeseries': df['date'].dt.normalize().rename('date_only'),
+        'monthly': df['date'].dt.to_period('M').rename('year_month'),
+        'yearly': df['date'].dt.year.rename('year'),
     }
+    if 'weather' in df.columns:
+        keys['by_weather'] = df['weather']
+    return keys
+
+@timed
+def partial_tables(df):
+    """计算可合并的部分聚合
 
-def make_tables(df):
-    """创建聚合表"""
+    每张表对应一个 {统计量: 数据框} 字典，包含 sum 和 count；
+    按日聚合额外包含 min、max 和行数 rows，供 KPI 立方体使用。
+    不同数据块的部分聚合可用 merge_partials 合并，再由 finalize_tables
+    得到与 make_tables 相同格式的均值表。
+    """
     if df is None or 'date' not in df.columns:
         return {}
-    
+
+    df = df[df['date'].notna()]
+    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    if len(df) == 0 or not numeric_cols:
+        return {}
+
+    # 和在 float64 中累加：float32 的累加结果依赖求和顺序，分块、分片或其他后端都无法复现
+    values = df[numeric_cols]
+    wide = values.astype({col: np.float64 for col in numeric_cols if values[col].dtype == np.float32})
+    partials = {}
+    for name, key in _group_keys(df).items():
+        grouped = values.groupby(key, observed=True)
+        stats = {'sum': wide.groupby(key, observed=True).sum(), 'count': grouped.count()}
+        if name == 'timeseries':
+            stats.update(min=grouped.min(), max=grouped.max(), rows=grouped.size())
+        for value in stats.values():
+            # 分类分组键转为普通索引，便于不同数据块之间合并
+            if isinstance(value.index, pd.CategoricalIndex):
+                value.index = value.index.astype(value.index.categories.dtype)
+        partials[name] = stats
+    return partials
+
+def _merge_stat(stat, left, right):
+    """合并单个统计量"""
+    if stat in ('min', 'max'):
+        combined = pd.concat([left, right]).groupby(level=0)
+        return combined.min() if stat == 'min' else combined.max()
+
+    merged = left.add(right, fill_value=0)
+    if isinstance(merged, pd.DataFrame):
+        merged = merged[list(dict.fromkeys([*left.columns, *right.columns]))]
+    return merged
+
+@timed
+def merge_partials(left, right):
+    """合并两组部分聚合"""
+    merged = dict(left)
+    for name, stats in right.items():
+        if name in merged:
+            stats = {
+                stat: _merge_stat(stat, merged[name][stat], value)
+                for stat, value in stats.items()
+            }
+        merged[name] = stats
+    return merged
+
+@timed
+def finalize_tables(partials):
+    """由部分聚合计算均值表"""
     tables = {}
-    df_work = df.copy()
-    
-    # 确保date是datetime类型
-    df_work['date'] = pd.to_datetime(df_work['date'], errors='coerce')
-    df_work = df_work.dropna(subset=['date'])
-    
-    if len(df_work) == 0:
-        return tables
-    
-    # 时间序列（按日期聚合）
-    numeric_cols = df_work.select_dtypes(include=[np.number]).columns.tolist()
-    if len(numeric_cols) > 0:
-        df_work['date_only'] = df_work['date'].dt.date
-        tables['timeseries'] = df_work.groupby('date_only')[numeric_cols].mean().reset_index()
+    for name, stats in partials.items():
+        means = (stats['sum'] / stats['count']).sort_index()
+        tables[name] = means.reset_index()
+    return format_tables(tables)
+
+def format_tables(tables):
+    """把均值表的分组键转换为展示格式（按日表的日期列、按月表的年月字符串）"""
+    if 'timeseries' in tables:
+        tables['timeseries']['date_only'] = tables['timeseries']['date_only'].dt.date
         tables['timeseries']['date'] = pd.to_datetime(tables['timeseries']['date_only'])
-    
-    # 按月聚合
-    df_monthly = df_work.copy()
-    df_monthly['year_month'] = df_work['date'].dt.to_period('M')
-    if len(numeric_cols) > 0:
-        tables['monthly'] = df_monthly.groupby('year_month')[numeric_cols].mean().reset_index()
+    if 'monthly' in tables:
         tables['monthly']['year_month'] = tables['monthly']['year_month'].astype(str)
-    
-    # 按年聚合
-    df_yearly = df_work.copy()
-    df_yearly['year_value'] = df_work['date'].dt.year
-    if len(numeric_cols) > 0:
-        tables['yearly'] = df_yearly.groupby('year_value')[numeric_cols].mean().reset_index()
-        tables['yearly'] = tables['yearly'].rename(columns={'year_value': 'year'})
-    
-    # 按天气类型聚合
-    if 'weather' in df_work.columns:
-        if len(numeric_cols) > 0:
-            tables['by_weather'] = df_work.groupby('weather')[numeric_cols].mean().reset_index()
-    
     return tables
 
-def calculate_kpis(df, filters=None):
-    """计算KPI"""
+@timed
+def make_tables(df, jobs=None):
+    """创建聚合表
+
+    jobs 大于 1 时按行分片，在多个进程中计算部分聚合（见 utils.parallel）。
+    """
+    if df is None or 'date' not in df.columns:
+        return {}
+
+    # 确保date是datetime类型
+    if not pd.api.types.is_datetime64_any_dtype(df['date']):
+        df = df.assign(date=pd.to_datetime(df['date'], errors='coerce'))
+
+    if jobs and jobs > 1:
+        from utils.parallel import parallel_partials
+        return finalize_tables(parallel_partials(df, jobs))
+
+    # 时间序列（按日期）、按月、按年、按天气类型聚合
+    return finalize_tables(partial_tables(df))
+
+@timed
+def make_tables_streaming(chunks):
+    """流式创建聚合表
+
+    chunks 为原始数据块的可迭代对象（如 utils.io.iter_chunks()），
+    每块单独清洗并归约为部分和与计数，峰值内存取决于分组数而非行数。
+    """
+    partials = {}
+    for chunk in chunks:
+        chunk_partials = partial_tables(clean_data(chunk))
+        partials = merge_partials(partials, chunk_partials)
+    return finalize_tables(partials)
+
+def _kpis_from_cube(cube, filters=None):
+    """由KPI立方体计算KPI，结果键与 calculate_kpis 一致"""
+    date_range = filters.get('date_range') if filters else None
+    stats = query_kpis(cube, date_range)
+
+    kpis = {}
+    if 'temperature' in stats:
+        kpis['avg_temperature'] = stats['temperature']['mean']
+        kpis['max_temperature'] = stats['temperature']['max']
+        kpis['min_temperature'] = stats['temperature']['min']
+    if 'humidity' in stats:
+        kpis['avg_humidity'] = stats['humidity']['mean']
+    if 'pressure' in stats:
+        kpis['avg_pressure'] = stats['pressure']['mean']
+    if 'wind_speed' in stats:
+        kpis['avg_wind_speed'] = stats['wind_speed']['mean']
+        kpis['max_wind_speed'] = stats['wind_speed']['max']
+
+    kpis['total_records'] = stats['total_records']
+    return kpis
+
+@timed
+def calculate_kpis(df, filters=None, cube=None):
+    """计算KPI；提供 cube（utils.cube.build_kpi_cube）时无需扫描数据"""
+    if cube is not None:
+        return _kpis_from_cube(cube, filters)
+
     if df is None:
         return {}
     
-    df_filtered = df.copy()
+    df_filtered = df
     
     # 应用日期过滤器
     if filters and 'date_range' in filters and filters['date_range']:
         if 'date' in df_filtered.columns:
             start_date, end_date = filters['date_range']
+            # 结束日期包含当天全天，与 KPI 立方体和过滤视图一致
             df_filtered = df_filtered[
                 (df_filtered['date'] >= pd.to_datetime(start_date)) &
-                (df_filtered['date'] <= pd.to_datetime(end_date))
+                (df_filtered['date'] < pd.to_datetime(end_date) + pd.Timedelta(days=1))
             ]
     
     kpis = {}
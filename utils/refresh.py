@@ -0,0 +1,245 @@
+"""
+增量刷新模块
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import pickle
+from pathlib import Path
+
+from utils.io import (
+    CACHE_DIR, DATA_DIR, complete_size, csv_header, discover_files,
+    iter_file_chunks, read_csv_range, read_files,
+)
+from utils.perf import timed
+from utils.prep import clean_data, concat_clean, merge_partials, partial_tables
+
+STATE_PATH = CACHE_DIR / "tables_state.pkl"
+STATE_VERSION = 3
+# 用于确认文件只是追加写入：比较文件开头和已读部分末尾的字节
+_MARKER_BYTES = 4096
+
+def _append_marker(path, offset):
+    """返回文件开头和 offset 之前若干字节的摘要"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        digest.update(f.read(min(offset, _MARKER_BYTES)))
+        f.seek(max(0, offset - _MARKER_BYTES))
+        digest.update(f.read(min(offset, _MARKER_BYTES)))
+    return digest.hexdigest()
+
+def _file_entry(path, offset=None):
+    """记录文件的已处理状态"""
+    stat = path.stat()
+    entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if path.suffix == ".csv":
+        entry["offset"] = offset
+        entry["columns"] = csv_header(path)
+        entry["marker"] = _append_marker(path, offset)
+    return entry
+
+def _plan(state, files):
+    """确定每个文件需要读取的字节范围；返回 None 表示需要全量重建"""
+    tracked = state["files"]
+    if set(tracked) - {str(path) for path in files}:
+        return None
+
+    plan = []
+    for path in files:
+        entry = tracked.get(str(path))
+        if entry is None:
+            plan.append((path, 0))
+            continue
+
+        stat = path.stat()
+        if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+            continue
+        # Parquet文件或被改写（而非追加）的CSV无法增量处理
+        if path.suffix != ".csv" or stat.st_size < entry["offset"]:
+            return None
+        if _append_marker(path, entry["offset"]) != entry["marker"]:
+            return None
+        plan.append((path, entry["offset"]))
+    return plan
+
+def _read_rows(path, start, columns=None):
+    """读取文件从 start 开始的完整行，返回数据块迭代器和新的结束偏移"""
+    if path.suffix != ".csv":
+        return iter_file_chunks(path), None
+
+    stop = complete_size(path)
+    if stop <= start:
+        return iter(()), start
+    return read_csv_range(path, start, stop, columns), stop
+
+def _read_whole(files):
+    """并行整体读取文件（CSV使用列式缓存，缓存缺失时解析后写入），返回 {路径: (数据框, 已读偏移)}
+
+    只处理末尾没有半行的非空CSV和Parquet文件；读取期间被追加的文件不在结果中，
+    由调用方按字节范围读取。
+    """
+    sizes = {}
+    for path in files:
+        size = path.stat().st_size
+        if path.suffix != ".csv":
+            sizes[path] = None
+        elif size > 0 and complete_size(path) == size:
+            sizes[path] = size
+
+    result = {}
+    for path, df in zip(sizes, read_files(list(sizes))):
+        if sizes[path] is None or path.stat().st_size == sizes[path]:
+            result[path] = (df, sizes[path])
+    return result
+
+def _split_range(path, start, stop, parts):
+    """把 [start, stop) 按行首切成约 parts 段，返回 [(段起点, 段终点), ...]"""
+    bounds = [start]
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            f.seek(start + (stop - start) * i // parts)
+            f.readline()
+            pos = f.tell()
+            if bounds[-1] < pos < stop:
+                bounds.append(pos)
+    bounds.append(stop)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _clean_range(path, start, stop, columns):
+    """工作进程：读取并清洗一段字节范围，返回 (清洗后的数据, 部分聚合)"""
+    frames = [clean_data(chunk, inplace=True) for chunk in read_csv_range(path, start, stop, columns)]
+    rows = concat_clean(frames)
+    return rows, partial_tables(rows) if rows is not None else {}
+
+def _read_parallel(pool, path, start, stop, columns, parts):
+    """在进程池中并行处理一个CSV的字节范围，按原顺序返回各段结果"""
+    columns = columns or csv_header(path)
+    tasks = _split_range(path, start, stop, parts)
+    return pool.map(_clean_range, *zip(*[(path, a, b, None if a == 0 else columns) for a, b in tasks]))
+
+def _empty_state(data_dir):
+    return {"version": STATE_VERSION, "data_dir": str(data_dir), "files": {}, "partials": {}}
+
+def load_state(state_path=STATE_PATH):
+    """读取持久化的增量状态，不存在或不兼容时返回 None"""
+    try:
+        with open(state_path, "rb") as f:
+            state = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+def save_state(state, state_path=STATE_PATH):
+    """原子地写入增量状态"""
+    try:
+        Path(state_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(state_path).with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(state_path)
+    except OSError:
+        pass
+
+@timed
+def refresh_tables(state=None, data_dir=DATA_DIR, state_path=STATE_PATH, jobs=None):
+    """增量刷新聚合表的部分和与计数
+
+    只读取上次刷新之后追加到CSV末尾的完整行（以及新出现的文件），
+    清洗后并入持久化的部分聚合，代价与新增数据量成正比。
+    文件被删除、截断或改写时自动退化为全量重建。
+
+    返回 (state, new_rows, rebuilt)：state["partials"] 可交给
+    utils.prep.finalize_tables；new_rows 为本次新处理的清洗后数据
+    （无新数据时为 None）；rebuilt 表示是否进行了全量重建。
+    从头读取的文件（全量重建和新出现的文件）在线程池中整体读取，并写入或使用
+    CSV的列式缓存（见 utils.io.read_csv_cached），之后冷启动的 load_rows 直接映射缓存。
+    jobs 大于 1 时改为把每个CSV的待读范围按行切段，在多个进程中清洗和部分聚合，
+    再按原顺序合并（部分聚合可以任意拆分合并，结果与串行一致）。
+    """
+    if state is None:
+        state = load_state(state_path)
+
+    files = discover_files(data_dir)
+    plan = None
+    if state is not None and state.get("data_dir") == str(data_dir):
+        plan = _plan(state, files)
+
+    rebuilt = plan is None
+    if rebuilt:
+        state = _empty_state(data_dir)
+        plan = [(path, 0) for path in files]
+    else:
+        state = {**state, "files": dict(state["files"])}
+
+    new_rows = []
+    partials = state["partials"]
+    pool = ProcessPoolExecutor(jobs) if jobs and jobs > 1 else None
+    whole = {} if pool is not None else _read_whole([path for path, start in plan if start == 0])
+    try:
+        for path, start in plan:
+            entry = state["files"].get(str(path), {})
+            if path in whole:
+                rows, stop = whole.pop(path)
+                rows = clean_data(rows, inplace=True)
+                partials = merge_partials(partials, partial_tables(rows))
+                new_rows.append(rows)
+            elif pool is not None and path.suffix == ".csv":
+                stop = complete_size(path)
+                for rows, partial in _read_parallel(pool, path, start, stop, entry.get("columns"), jobs):
+                    partials = merge_partials(partials, partial)
+                    new_rows.append(rows)
+            else:
+                chunks, stop = _read_rows(path, start, entry.get("columns"))
+                for chunk in chunks:
+                    # 原始块只在清洗期间存在，清洗时逐列释放
+                    chunk = clean_data(chunk, inplace=True)
+                    partials = merge_partials(partials, partial_tables(chunk))
+                    new_rows.append(chunk)
+            state["files"][str(path)] = _file_entry(path, stop)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    state["partials"] = partials
+
+    if plan or rebuilt:
+        save_state(state, state_path)
+
+    new_rows = concat_clean(new_rows)
+    return state, new_rows, rebuilt
+
+def state_fingerprint(state):
+    """返回已处理数据的指纹（文件路径、大小、修改时间和已读偏移）"""
+    digest = hashlib.sha1()
+    for key, entry in sorted(state["files"].items()):
+        digest.update(f"{key}|{entry['size']}|{entry['mtime_ns']}|{entry.get('offset')}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+@timed
+def load_rows(state, jobs=None):
+    """读取与状态中已处理范围完全一致的清洗后数据
+
+    文件自上次刷新后未变化时在线程池中整体读取（CSV使用列式缓存），
+    否则只读取已处理的字节范围；jobs 大于 1 时CSV在多个进程中分段读取。
+    """
+    frames = []
+    pool = ProcessPoolExecutor(jobs) if jobs and jobs > 1 else None
+    paths = [Path(key) for key in state["files"]]
+    unchanged = [path for path in paths if path.suffix != ".csv" or path.stat().st_size == state["files"][str(path)]["offset"]]
+    whole = _read_whole(unchanged) if pool is None else {}
+    try:
+        for path in paths:
+            entry = state["files"][str(path)]
+            if path in whole and whole[path][1] == entry.get("offset"):
+                frames.append(clean_data(whole.pop(path)[0], inplace=True))
+            elif pool is not None and path.suffix == ".csv":
+                frames.extend(rows for rows, _ in _read_parallel(pool, path, 0, entry["offset"], entry["columns"], jobs))
+            else:
+                # 只读取已处理的字节范围，每块就地清洗，同一时间只有一块原始数据在内存中
+                chunks = iter_file_chunks(path) if path.suffix != ".csv" else read_csv_range(path, 0, entry["offset"])
+                frames.extend(clean_data(chunk, inplace=True) for chunk in chunks)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return concat_clean([frame for frame in frames if frame is not None])
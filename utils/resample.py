@@ -0,0 +1,112 @@
+"""
+重采样模块
+按小时、日、周、月、年粒度聚合时间序列，支持均值、最值、标准差、计数和分位数
+"""
+import numpy as np
+import pandas as pd
+from utils.perf import timed
+from utils.view import view_cached
+
+# 由细到粗的粒度及其近似时长（秒），用于自动选择粒度
+GRANULARITIES = {
+    'hour': 3600,
+    'day': 86400,
+    'week': 7 * 86400,
+    'month': 30.44 * 86400,
+    'year': 365.25 * 86400,
+}
+REDUCERS = ('mean', 'min', 'max', 'std', 'count', 'p10', 'p25', 'p50', 'p75', 'p90')
+# 自动选择粒度时每条序列的最大点数（与 utils.viz.MAX_LINE_POINTS 一致）
+MAX_BINS = 2000
+
+def auto_granularity(start, end, max_bins=MAX_BINS):
+    """选择使 [start, end] 内的分组数不超过 max_bins 的最细粒度"""
+    span = (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds()
+    for granularity, seconds in GRANULARITIES.items():
+        if span / seconds < max_bins:
+            return granularity
+    return 'year'
+
+def _bin_starts(dates, granularity):
+    """把时间截断到所在分组的起点（周从周一开始）"""
+    if granularity == 'hour':
+        return dates.astype('datetime64[h]')
+    if granularity == 'day':
+        return dates.astype('datetime64[D]')
+    if granularity == 'week':
+        days = dates.astype('datetime64[D]')
+        # 1970-01-01 是周四，偏移 3 天后对 7 取余即为距周一的天数
+        return days - (days.view(np.int64) + 3) % 7
+    if granularity == 'month':
+        return dates.astype('datetime64[M]')
+    if granularity == 'year':
+        return dates.astype('datetime64[Y]')
+    raise ValueError(f"未知的粒度: {granularity}")
+
+def _reduce(values, starts, group, reducer):
+    """在按分组连续排列的数值上计算统计量，空分组为 NaN"""
+    valid = ~np.isnan(values)
+    n = np.add.reduceat(valid, starts).astype(np.int64)
+    if reducer == 'count':
+        return n
+
+    empty = n == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if reducer in ('mean', 'std'):
+            mean = np.add.reduceat(np.where(valid, values, 0.0), starts) / n
+            if reducer == 'mean':
+                return mean
+            # 两遍法：先求组均值，再累加离差平方，避免大数相减的精度损失
+            deviations = np.where(valid, values - mean[group], 0.0)
+            result = np.sqrt(np.add.reduceat(deviations ** 2, starts) / (n - 1))
+        elif reducer == 'min':
+            result = np.minimum.reduceat(np.where(valid, values, np.inf), starts)
+        elif reducer == 'max':
+            result = np.maximum.reduceat(np.where(valid, values, -np.inf), starts)
+        else:
+            # 分位数：组内排序（NaN 排在末尾），按线性插值取值，与 pandas 的 quantile 一致
+            q = int(reducer[1:]) / 100
+            ordered = values[np.lexsort((values, group))]
+            position = (np.maximum(n, 1) - 1) * q
+            lower = np.floor(position).astype(np.int64)
+            upper = np.ceil(position).astype(np.int64)
+            low, high = ordered[starts + lower], ordered[starts + upper]
+            result = low + (high - low) * (position - lower)
+    return np.where(empty, np.nan, result)
+
+@timed
+@view_cached
+def resample(df, granularity, columns, reducer='mean', time_range=None):
+    """按粒度重采样数值列，返回 date 列（分组起点）加各列统计量的数据框
+
+    要求 df 按 date 升序排列（见 utils.view.sort_by_date），此时每个分组
+    都是连续的行区间，可以用 ufunc.reduceat 一次算出所有分组，
+    time_range 也可以直接二分查找切片。只输出有数据的分组。
+    结果按视图和参数缓存，首次使用某个粒度时才计算。
+    """
+    if reducer not in REDUCERS:
+        raise ValueError(f"未知的统计量: {reducer}")
+    columns = list(columns)
+    dates = df['date'].to_numpy()
+
+    if not df['date'].is_monotonic_increasing:
+        order = np.argsort(dates, kind='stable')
+        df, dates = df.iloc[order], dates[order]
+    lo, hi = 0, int(np.searchsorted(dates, np.datetime64('NaT'), side='left'))
+    if time_range is not None:
+        start, end = (np.datetime64(pd.Timestamp(t)).astype(dates.dtype) for t in time_range)
+        lo = int(np.searchsorted(dates[:hi], start, side='left'))
+        hi = int(np.searchsorted(dates[:hi], end, side='right'))
+    if hi <= lo:
+        return pd.DataFrame(columns=['date', *columns])
+
+    bins = _bin_starts(dates[lo:hi], granularity)
+    starts = np.flatnonzero(np.concatenate(([True], bins[1:] != bins[:-1])))
+    counts = np.diff(np.append(starts, len(bins)))
+    group = np.repeat(np.arange(len(starts)), counts)
+
+    result = {'date': bins[starts].astype(dates.dtype)}
+    for col in columns:
+        values = df[col].iloc[lo:hi].to_numpy(dtype=np.float64, na_value=np.nan)
+        result[col] = _reduce(values, starts, group, reducer)
+    return pd.DataFrame(result)
@@ -0,0 +1,162 @@
+"""
+共享数据集存储模块
+把清洗后的数据写成内存映射的 Arrow 文件，所有会话和工作进程零拷贝共享同一份数据；
+追加的新行写成单独的段，累计到一定比例后再合并为一个文件
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from utils.io import CACHE_DIR
+from utils.perf import timed
+from utils.prep import concat_clean
+
+STORE_DIR = CACHE_DIR / "store"
+# 追加段的累计行数超过基础文件行数的该比例，或段数超过上限时，合并为一个文件。
+# 合并之前打开数据的每个进程都持有一份拼接后的完整副本（见 open_shared），
+# 比例取得较小，使不共享内存的时间窗口较短；合并的代价均摊到每个新行为常数
+COMPACT_RATIO = 0.05
+MAX_SEGMENTS = 64
+# 数据框 attrs 保存在 Arrow 模式元数据的该键下
+_ATTRS_KEY = b"climate.attrs"
+
+def store_path(fingerprint):
+    """返回指纹对应的共享数据文件路径"""
+    return STORE_DIR / f"{fingerprint}.arrow"
+
+def manifest_path(fingerprint):
+    """返回指纹对应的分段清单路径（数据由基础文件和若干追加段组成时使用）"""
+    return STORE_DIR / f"{fingerprint}.json"
+
+def _read_manifest(fingerprint):
+    """读取分段清单 {'base': 文件名, 'base_rows': 行数, 'deltas': [[文件名, 行数], ...]}，不存在时返回 None"""
+    try:
+        manifest = json.loads(manifest_path(fingerprint).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    names = [manifest["base"], *(name for name, _ in manifest["deltas"])]
+    if not all((STORE_DIR / name).exists() for name in names):
+        return None
+    return manifest
+
+def _remove_stale(keep):
+    """删除存储目录中不在 keep（文件名集合）里的数据文件和清单"""
+    for stale in STORE_DIR.iterdir():
+        if stale.suffix in (".arrow", ".json") and stale.name not in keep:
+            try:
+                stale.unlink()
+            except OSError:
+                # 其他进程仍在映射旧文件（Windows），下次再清理
+                pass
+
+def _column_array(series):
+    """把一列转换为 Arrow 数组，尽量保证读回时可以零拷贝
+
+    浮点列的 NaN 和时间列的 NaT 按原值写入而不转为空值：
+    没有空值位图的列在 to_pandas 时可以直接引用内存映射的缓冲区。
+    """
+    values = series.to_numpy()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        indices = pa.array(codes, mask=codes < 0) if (codes < 0).any() else pa.array(codes)
+        return pa.DictionaryArray.from_arrays(indices, pa.array(series.cat.categories.to_numpy(dtype=object)))
+    if values.dtype.kind == 'M':
+        # NaT 保留为 int64 最小值（pandas 读回时仍为 NaT）
+        unit = np.datetime_data(values.dtype)[0]
+        return pa.array(values.view(np.int64)).view(pa.timestamp(unit))
+    if values.dtype.kind in 'fiub':
+        return pa.array(values)
+    return pa.array(series, from_pandas=True)
+
+def _to_table(df):
+    """转换为 Arrow 表，并把可序列化的 attrs 写入模式元数据"""
+    table = pa.table([_column_array(df[col]) for col in df.columns], names=[str(col) for col in df.columns])
+    attrs = {key: value for key, value in df.attrs.items() if key == 'compaction'}
+    return table.replace_schema_metadata({_ATTRS_KEY: json.dumps(attrs).encode("utf-8")})
+
+def write_frame(df, path):
+    """把数据框写成未压缩的 Arrow 文件（先写临时文件再原子替换，其他进程不会读到不完整的文件）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    feather.write_feather(_to_table(df), tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+def map_frame(path):
+    """以内存映射方式读取 write_frame 写出的文件，返回只读数据框；无法读取时返回 None"""
+    try:
+        table = feather.read_table(path, memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+    df = table.to_pandas(split_blocks=True)
+    metadata = table.schema.metadata or {}
+    if _ATTRS_KEY in metadata:
+        df.attrs.update(json.loads(metadata[_ATTRS_KEY]))
+    return df
+
+@timed
+def publish(df, fingerprint):
+    """把数据写入共享存储（已存在时跳过），并清理其他指纹的旧文件和追加段"""
+    path = store_path(fingerprint)
+    if not path.exists():
+        write_frame(df, path)
+    _remove_stale({path.name})
+    return path
+
+@timed
+def append_segment(new_rows, fingerprint, base_fingerprint, base_rows):
+    """把追加的新行写成单独的段：fingerprint 的数据为 base_fingerprint 的各段加上这一段
+
+    写入量与新行数成正比。base_rows 为 base_fingerprint 的总行数。base_fingerprint 不在
+    存储中，或追加段累计超过 COMPACT_RATIO / MAX_SEGMENTS 时不写入并返回 False，
+    由调用方用 publish 写出完整文件（即合并各段）。
+    """
+    manifest = _read_manifest(base_fingerprint)
+    if manifest is None:
+        if not store_path(base_fingerprint).exists():
+            return False
+        manifest = {"base": store_path(base_fingerprint).name, "base_rows": base_rows, "deltas": []}
+
+    deltas = [*manifest["deltas"], [f"{fingerprint}.delta.arrow", len(new_rows)]]
+    if len(deltas) > MAX_SEGMENTS or sum(rows for _, rows in deltas) > COMPACT_RATIO * manifest["base_rows"]:
+        return False
+
+    write_frame(new_rows, STORE_DIR / deltas[-1][0])
+    manifest = {**manifest, "deltas": deltas}
+    path = manifest_path(fingerprint)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp_path, path)
+    _remove_stale({path.name, manifest["base"], *(name for name, _ in deltas)})
+    return True
+
+@timed
+def open_shared(fingerprint):
+    """以内存映射方式打开共享数据，返回只读数据框；不存在时返回 None
+
+    数值列和时间列直接引用映射的文件页，同一台机器上的所有进程
+    共享操作系统的页缓存，新增会话几乎不占用额外内存。
+    数据由基础文件和追加段组成时，映射各段后拼接：此时每个进程各自持有一份完整副本，
+    不再零拷贝共享，直到追加段被合并为一个文件（见 COMPACT_RATIO）。
+    """
+    path = store_path(fingerprint)
+    if path.exists():
+        return map_frame(path)
+    manifest = _read_manifest(fingerprint)
+    if manifest is None:
+        return None
+    frames = [map_frame(STORE_DIR / name) for name in [manifest["base"], *(name for name, _ in manifest["deltas"])]]
+    if any(frame is None for frame in frames):
+        return None
+    return concat_clean(frames)
+
+def share(df, fingerprint):
+    """发布数据并返回共享的只读版本；写入失败时原样返回 df"""
+    try:
+        publish(df, fingerprint)
+    except (OSError, pa.ArrowException):
+        return df
+    shared = open_shared(fingerprint)
+    return shared if shared is not None else df
@@ -0,0 +1,143 @@
+"""
+过滤视图模块
+"""
+from collections import OrderedDict
+import functools
+import weakref
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.perf import count_cache
+
+_VIEW_CACHE_SIZE = 16
+_view_cache = OrderedDict()
+
+def sort_by_date(df):
+    """按 date 列排序（已有序时原样返回，不复制）"""
+    if df is None or 'date' not in df.columns or df['date'].is_monotonic_increasing:
+        return df
+    return df.sort_values('date', kind='stable', na_position='last', ignore_index=True)
+
+def sorted_after(df, new_rows):
+    """已排序的 new_rows 接在已排序的 df 之后时整体是否仍按日期有序（只比较衔接处）"""
+    if 'date' not in df.columns or 'date' not in new_rows.columns or len(df) == 0 or len(new_rows) == 0:
+        return False
+    last, first = df['date'].iloc[-1], new_rows['date'].iloc[0]
+    return not pd.isna(last) and not pd.isna(first) and first >= last
+
+def date_span(df, column='date'):
+    """返回已按日期排序的 df 的首尾有效日期 (最早, 最晚)，没有有效日期时返回 None
+
+    NaT 排在末尾（见 sort_by_date），只需一次二分查找，不扫描整列。
+    """
+    if df is None or column not in df.columns:
+        return None
+    values = df[column].to_numpy()
+    if values.dtype.kind != 'M':
+        dates = df[column]
+        return (dates.min(), dates.max()) if dates.notna().any() else None
+    valid = int(np.searchsorted(values, np.datetime64('NaT')))
+    if valid == 0:
+        return None
+    return pd.Timestamp(values[0]), pd.Timestamp(values[valid - 1])
+
+def _date_bounds(dates, date_range):
+    """在有序日期数组上二分查找日期范围（含首尾两天）对应的行区间"""
+    start, end = (np.datetime64(pd.Timestamp(d).date(), 'D') for d in date_range)
+    values = np.asarray(dates)
+    lo = int(np.searchsorted(values, start.astype(values.dtype), side='left'))
+    hi = int(np.searchsorted(values, (end + 1).astype(values.dtype), side='left'))
+    return lo, hi
+
+def _slice_by_date(df, date_range, column='date'):
+    """按日期范围切片，返回共享底层数据的视图"""
+    if df is None or not date_range or column not in df.columns:
+        return df
+    lo, hi = _date_bounds(df[column].to_numpy(), date_range)
+    return df.iloc[lo:hi]
+
+def _prune_views(fingerprint):
+    """删除来源数据框已被释放或属于其他数据指纹的缓存视图（数据集重新发布后不再保留旧数据）"""
+    for key, (source, _) in list(_view_cache.items()):
+        if source() is None or (fingerprint is not None and isinstance(key[0], str) and key[0] != fingerprint):
+            del _view_cache[key]
+
+def filter_view(df, filters=None):
+    """返回应用侧边栏过滤器后的数据视图
+
+    要求 df 已按 date 排序（见 sort_by_date）：日期范围通过二分查找
+    解析为行区间并零拷贝切片。结果按 (数据指纹, 过滤条件) 缓存，
+    同一次运行中的所有页面共享同一个视图。缓存只弱引用来源数据框，
+    出现新的数据指纹时旧数据集的视图被丢弃，不会让旧数据常驻内存。
+    """
+    date_range = tuple(filters.get('date_range') or ()) if filters else ()
+    if df is None or not date_range:
+        return df
+
+    # 来源未知的数据框按 id 缓存，命中前确认弱引用仍指向同一对象（id 可能被复用）
+    base_key = view_key(df)
+    fingerprint = base_key[0] if base_key is not None else None
+    key = (fingerprint if fingerprint is not None else id(df), date_range)
+    entry = _view_cache.get(key)
+    hit = entry is not None and entry[0]() is df
+    count_cache('filter_view', hit)
+    if hit:
+        _view_cache.move_to_end(key)
+        return entry[1]
+
+    view = _slice_by_date(df, date_range)
+    if base_key is not None:
+        view.attrs['view_key'] = (fingerprint, date_range, len(view))
+    _prune_views(fingerprint)
+    _view_cache[key] = (weakref.ref(df), view)
+    if len(_view_cache) > _VIEW_CACHE_SIZE:
+        _view_cache.popitem(last=False)
+    return view
+
+def set_view_key(df, fingerprint):
+    """把数据指纹记录为完整数据集的视图键"""
+    df.attrs['view_key'] = (fingerprint, (), len(df))
+    return df
+
+def view_key(df):
+    """返回视图的缓存键 (数据指纹, 日期范围, 行数)；来源未知时返回 None
+
+    attrs 会随切片等操作传递给派生数据框，行数不一致时视为未知，
+    避免对子集误用整个视图的缓存结果。
+    """
+    key = df.attrs.get('view_key') if df is not None else None
+    if key is None or key[2] != len(df):
+        return None
+    return key
+
+def view_cached(func):
+    """按视图缓存 func(df, *args, **kwargs) 的结果
+
+    缓存键为视图键加上其余参数，数据框本身不参与哈希，
+    因此命中缓存的代价与数据行数无关。视图键未知时直接计算。
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @st.cache_data(max_entries=256, show_spinner=False)
+    def cached(name, key, args, kwargs, _df, _computed):
+        # _computed 不参与哈希，只在未命中、真正执行时被标记
+        _computed.append(True)
+        return func(_df, *args, **dict(kwargs))
+
+    @functools.wraps(func)
+    def wrapper(df, *args, **kwargs):
+        key = view_key(df)
+        if key is None:
+            return func(df, *args, **kwargs)
+        computed = []
+        result = cached(name, key, args, tuple(sorted(kwargs.items())), df, computed)
+        count_cache(name, hit=not computed)
+        return result
+    return wrapper
+
+def filter_tables(tables, filters=None):
+    """返回按日期范围切片后的聚合表（仅按日的时间序列表随日期变化）"""
+    date_range = filters.get('date_range') if filters else None
+    if not tables or not date_range or 'timeseries' not in tables:
+        return tables
+    return {**tables, 'timeseries': _slice_by_date(tables['timeseries'], date_range)}
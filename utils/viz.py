@@ -1,29 +1,121 @@
 """
 可视化模块
 """
-import plotly.express as px
 import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
 import streamlit as st
+from utils.corr import comoments, correlation_matrix
+from utils.figcache import figure_cached
+from utils.perf import timed
+from utils.view import view_cached
 
 COLOR_PALETTE = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
 
-def line_chart(df, x_col, y_cols, title="", x_label="", y_label=""):
-    """创建折线图"""
+# 每条折线最多发送到浏览器的点数
+MAX_LINE_POINTS = 2000
+# 原始点数超过该值时改用 WebGL 渲染
+WEBGL_THRESHOLD = 5000
+# 显示的点数超过该值时不再绘制标记点
+MARKER_THRESHOLD = 500
+# 箱线图每个类别最多发送的离群点数
+MAX_BOX_OUTLIERS = 200
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets 降采样，返回保留点的下标
+
+    保留首尾两点，其余每个桶选出与前一个选中点和下一个桶均值
+    构成三角形面积最大的点，从而保留峰值和形状特征。
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = np.abs(
+            (x[prev] - avg_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (avg_y - y[prev])
+        )
+        prev = lo + int(np.argmax(area))
+        selected[i + 1] = prev
+    return selected
+
+def _slice_x_range(df, x_col, x_range):
+    """按 x 范围对有序数据切片（二分查找，零拷贝）"""
+    x = df[x_col].to_numpy()
+    start, end = x_range
+    if np.issubdtype(x.dtype, np.datetime64):
+        start, end = (pd.Timestamp(v).to_datetime64().astype(x.dtype) for v in x_range)
+    lo = int(np.searchsorted(x, start, side='left'))
+    hi = int(np.searchsorted(x, end, side='right'))
+    return df.iloc[lo:hi]
+
+@timed
+@figure_cached
+def line_chart(df, x_col, y_cols, title="", x_label="", y_label="",
+               max_points=MAX_LINE_POINTS, x_range=None, highlights=None, highlight_label="anomaly"):
+    """创建折线图
+
+    每条折线用 LTTB 降采样到最多 max_points 个点；原始点数较多时
+    改用 WebGL (Scattergl) 并去掉标记点。x_range 用于缩放：只对该范围内
+    的数据降采样，从而得到更高分辨率的局部图。
+    highlights 为 {列名: 数据框(x_col, value, zscore)}，以空心圆标出这些点。
+    """
     fig = go.Figure()
     
     if isinstance(y_cols, str):
         y_cols = [y_cols]
-    
+
+    if x_range is not None:
+        df = _slice_x_range(df, x_col, x_range)
+
+    x_all = df[x_col].to_numpy()
+    x_numeric = x_all.view(np.int64) if np.issubdtype(x_all.dtype, np.datetime64) else x_all
+
     for col in y_cols:
         if col in df.columns:
-            fig.add_trace(go.Scatter(
-                x=df[x_col],
-                y=df[col],
-                mode='lines+markers',
+            y_all = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = ~np.isnan(y_all)
+            x, y, x_num = x_all[valid], y_all[valid], x_numeric[valid]
+
+            if len(y) > max_points:
+                keep = lttb(x_num, y, max_points)
+                x, y = x[keep], y[keep]
+
+            trace_type = go.Scattergl if valid.sum() > WEBGL_THRESHOLD else go.Scatter
+            fig.add_trace(trace_type(
+                x=x,
+                y=y,
+                mode='lines+markers' if len(y) <= MARKER_THRESHOLD else 'lines',
                 name=col,
                 hovertemplate=f'<b>{col}</b><br>{x_label}: %{{x}}<br>{y_label}: %{{y:.2f}}<extra></extra>'
             ))
+
+    for col, points in (highlights or {}).items():
+        if col not in y_cols or len(points) == 0:
+            continue
+        if x_range is not None:
+            points = _slice_x_range(points, x_col, x_range)
+        fig.add_trace(go.Scatter(
+            x=points[x_col].to_numpy(),
+            y=points['value'].to_numpy(),
+            customdata=points['zscore'].to_numpy(),
+            mode='markers',
+            name=f"{col} {highlight_label}",
+            marker=dict(color='#d62728', size=9, symbol='circle-open', line=dict(width=2)),
+            hovertemplate=f'<b>{col} {highlight_label}</b><br>{x_label}: %{{x}}<br>{y_label}: %{{y:.2f}}'
+                          f'<br>z: %{{customdata:.1f}}<extra></extra>'
+        ))
     
     fig.update_layout(
         title=title,
@@ -37,8 +129,12 @@ def line_chart(df, x_col, y_cols, title="", x_label="", y_label=""):
     
     return fig
 
+@timed
+@figure_cached
 def bar_chart(df, x_col, y_col, title="", x_label="", y_label=""):
     """创建柱状图"""
+    # plotly.express 导入较慢（约 0.1s），只在用到的图表中按需导入
+    import plotly.express as px
     fig = px.bar(
         df, x=x_col, y=y_col,
         title=title,
@@ -52,6 +148,8 @@ def bar_chart(df, x_col, y_col, title="", x_label="", y_label=""):
     )
     return fig
 
+@timed
+@figure_cached
 def map_chart(df, lat_col, lon_col, color_col, title=""):
     """创建地图"""
     if lat_col not in df.columns or lon_col not in df.columns:
@@ -61,6 +159,7 @@ def map_chart(df, lat_col, lon_col, color_col, title=""):
     if len(df_map) == 0:
         return None
     
+    import plotly.express as px
     fig = px.scatter_mapbox(
         df_map,
         lat=lat_col,
@@ -74,29 +173,126 @@ def map_chart(df, lat_col, lon_col, color_col, title=""):
     fig.update_layout(margin=dict(l=0, r=0, t=30, b=0))
     return fig
 
+@timed
+@view_cached
+def histogram_bins(df, col, bins=30):
+    """在服务端分箱，返回 (计数, 箱边界)；按 (视图, 列, 箱数) 缓存"""
+    values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(1)
+    return np.histogram(values, bins=bins)
+
+@timed
+@figure_cached
 def distribution_chart(df, col, title="", bins=30):
-    """创建分布图"""
-    fig = px.histogram(
-        df, x=col, title=title, nbins=bins,
-        color_discrete_sequence=[COLOR_PALETTE[0]]
-    )
+    """创建分布图（只把各箱的计数发送到浏览器，数据量与行数无关）"""
+    counts, edges = histogram_bins(df, col, bins)
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        marker_color=COLOR_PALETTE[0],
+        hovertemplate='%{customdata[0]:.2f} – %{customdata[1]:.2f}<br>count: %{y}<extra></extra>'
+    ))
     fig.update_layout(
+        title=title,
+        xaxis_title=col,
+        yaxis_title='count',
+        bargap=0,
         template='plotly_white',
         height=400,
         showlegend=False
     )
     return fig
 
-def box_plot(df, x_col, y_col, title=""):
-    """创建箱线图"""
-    fig = px.box(df, x=x_col, y=y_col, title=title, color_discrete_sequence=COLOR_PALETTE)
-    fig.update_layout(template='plotly_white', height=400)
+@timed
+@view_cached
+def box_stats(df, x_col, y_col, top_n=None):
+    """按类别计算箱线图统计量，返回 (统计表, 离群点样本)
+
+    四分位数由一次 groupby 分位数计算得到；须线为 Tukey 规则
+    （1.5 倍四分位距）内的最小/最大值；每个类别最多保留
+    MAX_BOX_OUTLIERS 个离群点的随机样本。只保留记录数最多的 top_n 个类别。
+    """
+    data = df[[x_col, y_col]].dropna()
+    counts = data[x_col].value_counts()
+    counts = counts[counts > 0]
+    if top_n is not None:
+        counts = counts.head(top_n)
+    data = data[data[x_col].isin(counts.index)]
+    keys = data[x_col].astype(object) if isinstance(data[x_col].dtype, pd.CategoricalDtype) else data[x_col]
+
+    grouped = data[y_col].groupby(keys, observed=True)
+    stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ['q1', 'median', 'q3']
+    stats['mean'] = grouped.mean()
+    stats = stats.reindex(counts.index)
+    stats['count'] = counts
+
+    # 每行对应类别的围栏，用于确定须线和离群点
+    iqr = stats['q3'] - stats['q1']
+    low = keys.map(stats['q1'] - 1.5 * iqr).to_numpy(dtype=np.float64)
+    high = keys.map(stats['q3'] + 1.5 * iqr).to_numpy(dtype=np.float64)
+    values = data[y_col].to_numpy(dtype=np.float64)
+    inside = (values >= low) & (values <= high)
+
+    inside_values = data[y_col][inside].groupby(keys[inside], observed=True)
+    stats['lowerfence'] = inside_values.min()
+    stats['upperfence'] = inside_values.max()
+
+    outliers = pd.DataFrame({x_col: keys[~inside], y_col: data[y_col][~inside]})
+    if len(outliers) > 0:
+        shuffled = outliers.sample(frac=1.0, random_state=0)
+        outliers = shuffled.groupby(x_col, observed=True).head(MAX_BOX_OUTLIERS)
+    return stats, outliers.reset_index(drop=True)
+
+@timed
+@figure_cached
+def box_plot(df, x_col, y_col, title="", top_n=None):
+    """创建箱线图（统计量在服务端预先计算，只发送箱体和离群点样本）"""
+    stats, outliers = box_stats(df, x_col, y_col, top_n)
+    categories = [str(category) for category in stats.index]
+
+    fig = go.Figure()
+    fig.add_trace(go.Box(
+        x=categories,
+        q1=stats['q1'],
+        median=stats['median'],
+        q3=stats['q3'],
+        lowerfence=stats['lowerfence'],
+        upperfence=stats['upperfence'],
+        mean=stats['mean'],
+        name=y_col,
+        marker_color=COLOR_PALETTE[0],
+        boxpoints=False
+    ))
+    if len(outliers) > 0:
+        fig.add_trace(go.Scatter(
+            x=outliers[x_col].astype(str),
+            y=outliers[y_col],
+            mode='markers',
+            name='outliers',
+            marker=dict(color=COLOR_PALETTE[0], size=4, opacity=0.6),
+            hovertemplate=f'<b>%{{x}}</b><br>{y_col}: %{{y:.2f}}<extra></extra>'
+        ))
+    fig.update_layout(
+        title=title,
+        xaxis_title=x_col,
+        yaxis_title=y_col,
+        showlegend=False,
+        template='plotly_white',
+        height=400
+    )
     return fig
 
-def correlation_heatmap(df, title="相关性热力图"):
-    """创建相关性热力图"""
-    numeric_df = df.select_dtypes(include=['float64', 'int64'])
-    corr_matrix = numeric_df.corr()
+@timed
+@figure_cached
+def correlation_heatmap(df, title="相关性热力图", corr_matrix=None):
+    """创建相关性热力图；可直接传入 utils.corr.correlation_matrix 的结果"""
+    if corr_matrix is None:
+        corr_matrix = correlation_matrix(comoments(df), pairwise=True)
     
     fig = go.Figure(data=go.Heatmap(
         z=corr_matrix.values,
@@ -112,3 +308,8 @@ def correlation_heatmap(df, title="相关性热力图"):
     
     fig.update_layout(title=title, height=500, template='plotly_white')
     return fig
+
+@timed
+def show_chart(fig, **kwargs):
+    """在页面中渲染图表（耗时包含 Plotly 序列化），参数同 st.plotly_chart"""
+    return st.plotly_chart(fig, **kwargs)